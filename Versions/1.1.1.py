@@ -5,13 +5,35 @@ import sys, os, datetime
 import re
 import json
 import random
+import sqlite3
+import stat
+import threading
+import time
+import concurrent.futures
+import hashlib
+import bisect
+import mmap
+import struct
+from collections import OrderedDict, defaultdict
+import base64
+import multiprocessing
+import ctypes
+import ctypes.util
+import platform
+from array import array
 import urllib.parse
+import pathlib
 from PyQt5 import QtWidgets, QtGui, QtCore
 import vlc
-from mutagen.id3 import ID3, APIC
+import mutagen
+from mutagen.flac import Picture
 from tinytag import TinyTag
 import html
 from functools import partial
+try:
+    import numpy  # optional: vectorizes cover palettes and search index intersections
+except ImportError:
+    numpy = None
 
 album_bg = None
 
@@ -23,6 +45,42 @@ SUPPORTED_FORMATS = (
     '.voc', '.vox', '.wav', '.wma', '.wv', '.webm', '.8svx', '.cda'
 )
 PLAYLISTS_FILE = "playlists.json"
+INDEX_FILE = "library_index.db"
+LIBRARY_ROOTS_FILE = "library_roots.json"
+THUMBNAIL_DIR = "thumbnail_cache"
+THUMBNAIL_SIZE = 32  # album tree icon size
+COVER_SIZES = (THUMBNAIL_SIZE, 120, 300, 1000)  # variants CoverStore keeps of every cover; the last caps the large one
+THUMBNAIL_PACK = "thumbnails.pack"  # inside THUMBNAIL_DIR, holds every THUMBNAIL_SIZE variant
+PACK_COMPACT_RATIO = 0.3  # compact the pack once this share of it is superseded or unused records
+COVER_ALIASES = "aliases.pack"  # inside THUMBNAIL_DIR, maps cover sources to the content hash of their cover
+COVER_HASH_TEXT = "cover-hash"  # QImage text key CoverStore puts the content hash under
+COVER_FILE_NAMES = ("cover", "folder", "front")  # sidecar album art, in order of preference
+COVER_FILE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+PALETTE_COLORS = 6  # median-cut boxes per cover; the theme picks its colours from these
+PALETTE_SAMPLE_SIZE = 32  # covers are sampled at most this big for the palette
+SCAN_WORKERS = 4  # threads IndexerWorker fans artists out over
+TAG_WORKERS = os.cpu_count() or 4  # processes reading tags in tag-driven mode
+TAG_CHUNK_SIZE = 500
+ALBUM_BATCH_SIZE = 200  # IndexerWorker streams albums to the GUI every this many albums...
+ALBUM_BATCH_SECONDS = 0.1  # ...or this often, whichever comes first
+COVER_BATCH_SIZE = 25
+COVER_CHUNK_SIZE = 50  # albums per CoverArtExtractionTask when a CoverArtJob fans out over cover_pool()
+COVER_PREFETCH_ROWS = 20  # AlbumTree also loads covers this many rows below the viewport
+COVER_REQUEST_DELAY_MS = 40  # coalesces scroll/expand events before AlbumTree asks for covers
+NOW_PLAYING_COVER_PRIORITY = 1 << 30  # the playing album's cover jumps every queued tree cover
+COVER_KEEP_LOADED = 300  # past this many loaded covers AlbumTree drops the ones that are off screen
+BACKDROP_BLUR_SIZE = 16  # the now-playing backdrop is the cover squeezed to this size and blown up again
+BACKDROP_SIZE = 256  # size the backdrop is made at; the widget scales it the rest of the way
+BACKDROP_DARKEN = 0.55  # opacity of the black laid over the backdrop, so white text stays readable
+BACKDROP_CACHE_ALBUMS = 32  # backdrops kept in the LRU (256 KB each at BACKDROP_SIZE)
+PIXMAP_CACHE_BYTES = 48 * 1024 * 1024  # budget of the GUI's decoded cover pixmaps, see PixmapCache
+TAG_ALBUM_PREFIX = "tag:"
+RESCAN_OPS_PER_SEC = 200  # default I/O budget for background rescans, per root
+RESCAN_BYTES_PER_SEC = 4 * 1024 * 1024
+RESCAN_BACKOFF = 10  # rescans slow down this much while playback reads from the same device
+TAG_READ_BYTES = 128 * 1024  # what one tag read is charged against a bytes budget
+FINGERPRINT_BYTES = 64 * 1024  # hashed from both the start and the end of each track
+IOPRIO_SET_SYSCALL = {"x86_64": 251, "amd64": 251, "i386": 289, "i686": 289, "aarch64": 30, "arm64": 30, "armv7l": 314}
 def resource_path(relative_path):
     try:
         base_path = sys._MEIPASS
@@ -31,6 +89,98 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 def natural_sort_key(s):
     return [int(text) if text.isdigit() else text.lower() for text in re.split(r'([0-9]+)', s)]
+def tag_album_key(root, artist, album):
+    """Album key for tag-driven mode; albums there aren't tied to a single folder."""
+    return TAG_ALBUM_PREFIX + os.path.join(root, artist.casefold(), album.casefold())
+def load_library_roots():
+    """
+    Library roots from LIBRARY_ROOTS_FILE as dicts with "path", "workers", "rescan_minutes",
+    "io_ops_per_sec" and "io_bytes_per_sec". workers is the scan concurrency for that drive,
+    rescan_minutes 0 means only on demand, io_* is the budget background rescans of that drive get.
+    """
+    if not os.path.exists(LIBRARY_ROOTS_FILE):
+        return []
+    try:
+        with open(LIBRARY_ROOTS_FILE, "r", encoding="utf-8") as f:
+            roots = json.load(f)
+    except Exception as e:
+        print("[DEBUG] Error loading library roots:", e)
+        return []
+    return [
+        {"path": os.path.abspath(r["path"]), "workers": int(r.get("workers", SCAN_WORKERS)),
+         "rescan_minutes": float(r.get("rescan_minutes", 0)),
+         "io_ops_per_sec": float(r.get("io_ops_per_sec", RESCAN_OPS_PER_SEC)),
+         "io_bytes_per_sec": float(r.get("io_bytes_per_sec", RESCAN_BYTES_PER_SEC))}
+        for r in roots if r.get("path")
+    ]
+def save_library_roots(roots):
+    try:
+        with open(LIBRARY_ROOTS_FILE, "w", encoding="utf-8") as f:
+            json.dump(roots, f, indent=4)
+    except Exception as e:
+        print("[DEBUG] Error saving library roots:", e)
+def library_roots_from_text(text):
+    """Roots typed into the splash screen (separated by ';'), keeping saved per-root settings."""
+    saved = {r["path"]: r for r in load_library_roots()}
+    roots = []
+    for part in text.split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        path = os.path.abspath(part)
+        if any(r["path"] == path for r in roots):
+            continue
+        roots.append(saved.get(path, {"path": path, "workers": SCAN_WORKERS, "rescan_minutes": 0,
+                                      "io_ops_per_sec": RESCAN_OPS_PER_SEC, "io_bytes_per_sec": RESCAN_BYTES_PER_SEC}))
+    return roots
+def library_root_of(path, roots):
+    """The path of the root in roots that path lives under, or None."""
+    path = album_location(path)
+    for root in roots:
+        if path == root["path"] or path.startswith(os.path.join(root["path"], "")):
+            return root["path"]
+    return None
+def is_tag_album(album_path):
+    return album_path.startswith(TAG_ALBUM_PREFIX)
+def album_location(album_path):
+    """The filesystem path an album key lives under (strips the tag-mode prefix)."""
+    return album_path[len(TAG_ALBUM_PREFIX):] if is_tag_album(album_path) else album_path
+def device_of(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+def lower_io_priority():
+    """
+    Move the calling thread to the OS's idle/background I/O class so playback reads win:
+    ioprio_set(IOPRIO_CLASS_IDLE) on Linux, THREAD_MODE_BACKGROUND_BEGIN on Windows,
+    IOPOL_THROTTLE on macOS. Returns False where none of these is available.
+    """
+    try:
+        if sys.platform.startswith("linux"):
+            nr = IOPRIO_SET_SYSCALL.get(platform.machine().lower())
+            if nr is None:
+                return False
+            libc = ctypes.CDLL(None, use_errno=True)
+            # IOPRIO_WHO_PROCESS with pid 0 is the calling thread; IDLE class (3) << IOPRIO_CLASS_SHIFT (13)
+            return libc.syscall(nr, 1, 0, 3 << 13) == 0
+        if sys.platform == "win32":
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 0x00010000))
+        if sys.platform == "darwin":
+            libc = ctypes.CDLL(ctypes.util.find_library("c"))
+            # IOPOL_TYPE_DISK, IOPOL_SCOPE_THREAD, IOPOL_THROTTLE
+            return libc.setiopolicy_np(0, 1, 3) == 0
+    except (OSError, AttributeError):
+        pass
+    return False
+def dir_mtime(path):
+    """mtime of path if it is a directory, else None (one stat call)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime if stat.S_ISDIR(st.st_mode) else None
 def ms_to_mmss(ms):
     seconds = int(ms / 1000)
     minutes = seconds // 60
@@ -39,6 +189,69 @@ def ms_to_mmss(ms):
 def get_contrasting_color(color: QtGui.QColor) -> QtGui.QColor:
     luminance = 0.299 * color.red() + 0.587 * color.green() + 0.114 * color.blue()
     return QtGui.QColor("black") if luminance > 128 else QtGui.QColor("white")
+def contrast_ratio(a: QtGui.QColor, b: QtGui.QColor) -> float:
+    """WCAG contrast ratio of two colours, 1 (same) to 21 (black on white)."""
+    def luminance(c):
+        channels = [v / 255 for v in (c.red(), c.green(), c.blue())]
+        r, g, b = [v / 12.92 if v <= 0.03928 else ((v + 0.055) / 1.055) ** 2.4 for v in channels]
+        return 0.2126 * r + 0.7152 * g + 0.0722 * b
+    hi, lo = sorted((luminance(a), luminance(b)), reverse=True)
+    return (hi + 0.05) / (lo + 0.05)
+def median_cut(pixels, colors):
+    """
+    [(count, (r, g, b))] of up to colors boxes, most populous first. pixels is an (n, 3)
+    numpy array or a list of (r, g, b) tuples; the box with the widest channel range is
+    split at its median on that channel until there are enough boxes.
+    """
+    if numpy is not None:
+        boxes = [numpy.asarray(pixels, dtype=numpy.int16).reshape(-1, 3)]
+        spread = lambda box: (box.max(axis=0) - box.min(axis=0)) if len(box) > 1 else numpy.zeros(3, int)
+        ordered = lambda box, channel: box[numpy.argsort(box[:, channel], kind="stable")]
+        mean = lambda box: tuple(int(v) for v in box.mean(axis=0).round())
+    else:
+        boxes = [list(pixels)]
+        spread = lambda box: [max(p[c] for p in box) - min(p[c] for p in box) for c in range(3)] if len(box) > 1 else [0, 0, 0]
+        ordered = lambda box, channel: sorted(box, key=lambda p: p[channel])
+        mean = lambda box: tuple(round(sum(p[c] for p in box) / len(box)) for c in range(3))
+    boxes = [b for b in boxes if len(b)]
+    while 0 < len(boxes) < colors:
+        ranges = [spread(box) for box in boxes]
+        i = max(range(len(boxes)), key=lambda i: max(ranges[i]))
+        if max(ranges[i]) == 0:
+            break
+        channel = max(range(3), key=lambda c: ranges[i][c])
+        box = ordered(boxes.pop(i), channel)
+        boxes += [box[:len(box) // 2], box[len(box) // 2:]]
+    return sorted(((len(box), mean(box)) for box in boxes), key=lambda b: -b[0])
+def cover_palette(image: QtGui.QImage):
+    """
+    (primary, secondary, text) colour names for a cover: primary is its most common median-cut
+    colour, secondary the one that stands out most from it weighted by how much of the cover
+    it covers, text a palette colour (or black/white) readable on primary. None for a null image.
+    """
+    if image is None or image.isNull():
+        return None
+    if max(image.width(), image.height()) > PALETTE_SAMPLE_SIZE:
+        image = image.scaled(PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+    image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+    w, h, stride = image.width(), image.height(), image.bytesPerLine()
+    data = image.constBits().asstring(stride * h)
+    if numpy is not None:
+        # Format_RGB32 is 0xffRRGGBB, i.e. B, G, R, 0xff in memory on little-endian machines
+        pixels = numpy.frombuffer(data, numpy.uint8).reshape(h, stride)[:, :w * 4].reshape(-1, 4)[:, 2::-1]
+    else:
+        pixels = [(data[y * stride + x * 4 + 2], data[y * stride + x * 4 + 1], data[y * stride + x * 4])
+                  for y in range(h) for x in range(w)]
+    boxes = [(count, QtGui.QColor(*rgb)) for count, rgb in median_cut(pixels, PALETTE_COLORS)]
+    primary = boxes[0][1]
+    distance = lambda c: ((c.red() - primary.red()) ** 2 + (c.green() - primary.green()) ** 2 + (c.blue() - primary.blue()) ** 2) ** 0.5
+    rest = [(count * distance(color), color) for count, color in boxes[1:]]
+    secondary = max(rest, key=lambda r: r[0])[1] if rest and max(r[0] for r in rest) > 0 else (
+        primary.darker(140) if primary.lightness() > 128 else primary.lighter(160))
+    readable = [color for _count, color in boxes[1:] if contrast_ratio(color, primary) >= 4.5]
+    text = readable[0] if readable else max((QtGui.QColor("black"), QtGui.QColor("white")),
+                                           key=lambda c: contrast_ratio(c, primary))
+    return primary.name(), secondary.name(), text.name()
 def fill_square_pixmap(original_pixmap, size=32, bg_color=QtCore.Qt.black):
     return original_pixmap.scaled(size, size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
 def create_placeholder_pixmap(size=120, text="No Cover"):
@@ -69,43 +282,677 @@ def parse_lrc(lrc_file, offset_ms=0):
     except Exception as e:
         print("[DEBUG] parse_lrc: Exception reading file:", e)
     return lyrics
+TRACK_TAG_FIELDS = ("title", "artist", "album", "albumartist", "track_no", "disc_no", "duration")
+def file_fingerprint(path, size, mtime):
+    """
+    Cheap identity for a track that survives renames and moves: size, whole-second mtime
+    and a blake2b of its first and last FINGERPRINT_BYTES. "" if the file can't be read.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            h.update(f.read(FINGERPRINT_BYTES))
+            if size > FINGERPRINT_BYTES:
+                f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+                h.update(f.read(FINGERPRINT_BYTES))
+    except OSError:
+        return ""
+    return f"{size}:{int(mtime)}:{h.hexdigest()}"
+def relink_playlists(relocations):
+    """Point PLAYLISTS_FILE entries at the new paths of moved tracks. Returns how many entries changed."""
+    if not relocations or not os.path.exists(PLAYLISTS_FILE):
+        return 0
+    try:
+        with open(PLAYLISTS_FILE, "r", encoding="utf-8") as f:
+            playlists = json.load(f)
+    except Exception as e:
+        print("[DEBUG] Error loading playlists:", e)
+        return 0
+    moved = {os.path.normcase(os.path.normpath(old)): new for old, new in relocations.items()}
+    changed = 0
+    for songs in playlists.values():
+        for i, song in enumerate(songs):
+            new = moved.get(os.path.normcase(os.path.normpath(song)))
+            if new:
+                songs[i] = new
+                changed += 1
+    if changed:
+        try:
+            with open(PLAYLISTS_FILE, "w", encoding="utf-8") as f:
+                json.dump(playlists, f, indent=4)
+        except Exception as e:
+            print("[DEBUG] Error saving playlists:", e)
+    return changed
+def read_tags_chunk(paths):
+    """read_track_tags over a list of paths; module level so a process pool can pickle it."""
+    return [read_track_tags(path) for path in paths]
+def read_track_tags(path):
+    try:
+        tag = TinyTag.get(path)
+    except Exception as e:
+        print(f"[DEBUG] read_track_tags: Could not read {path}: {e}")
+        return {"title": "", "artist": "", "album": "", "albumartist": "",
+                "track_no": 0, "disc_no": 0, "duration": 0.0}
+    return {
+        "title": tag.title or "",
+        "artist": tag.artist or "",
+        "album": tag.album or "",
+        "albumartist": tag.albumartist or "",
+        "track_no": int(tag.track) if str(tag.track or "").isdigit() else 0,
+        "disc_no": int(tag.disc) if str(tag.disc or "").isdigit() else 0,
+        "duration": float(tag.duration or 0.0),
+    }
+def extract_cover_data(song_path):
+    """
+    Raw bytes of the first embedded picture in song_path, or None: ID3 APIC frames
+    (MP3, WAV, AIFF), FLAC picture blocks, MP4 covr atoms and Vorbis/Opus
+    METADATA_BLOCK_PICTURE comments.
+    """
+    audio = mutagen.File(song_path)
+    if audio is None:
+        return None
+    for picture in getattr(audio, "pictures", None) or []:
+        if picture.data:
+            return picture.data
+    tags = audio.tags
+    if not tags:
+        return None
+    if hasattr(tags, "getall"):
+        for frame in tags.getall("APIC"):
+            if frame.data:
+                return frame.data
+        return None
+    for covr in tags.get("covr") or []:
+        return bytes(covr)
+    for block in tags.get("metadata_block_picture") or []:
+        try:
+            data = Picture(base64.b64decode(block)).data
+        except Exception:
+            continue
+        if data:
+            return data
+    return None
+def cover_hash(image):
+    """Content hash of a cover image that came from the CoverStore, or None."""
+    if image is None or isinstance(image, QtGui.QPixmap):
+        return None
+    return image.text(COVER_HASH_TEXT) or None
+def decode_cover(data, size=None):
+    """
+    data decoded into a QImage (null if it isn't an image). Given the size it is wanted at,
+    a JPEG at least twice that big is decoded at 1/2, 1/4 or 1/8 scale by libjpeg's DCT
+    (QImageReader.setScaledSize), the smallest that still covers size, instead of being
+    decoded at full resolution only to be scaled down.
+    """
+    buffer = QtCore.QBuffer()
+    buffer.setData(QtCore.QByteArray(data))
+    buffer.open(QtCore.QIODevice.ReadOnly)
+    reader = QtGui.QImageReader(buffer)
+    if size and reader.format() in (b"jpeg", b"jpg"):
+        full = reader.size()
+        longest = max(full.width(), full.height())
+        scale = next((n for n in (8, 4, 2) if longest >= n * size), 1)
+        if scale > 1:
+            # the size libjpeg itself produces at 1/scale, so Qt doesn't rescale on top
+            reader.setScaledSize(QtCore.QSize(-(-full.width() // scale), -(-full.height() // scale)))
+    return reader.read()
+def cover_file_name(names):
+    """The best sidecar cover (see COVER_FILE_NAMES) among the file names of one directory, or None."""
+    best = None
+    for name in names:
+        stem, ext = os.path.splitext(name.lower())
+        if ext in COVER_FILE_EXTENSIONS and stem in COVER_FILE_NAMES:
+            rank = COVER_FILE_NAMES.index(stem)
+            if best is None or rank < best[0]:
+                best = (rank, name)
+    return best[1] if best else None
+def cover_source(song_path, cover_ref=""):
+    """
+    The file song_path's cover is read from: the sidecar a "file:" cover_ref names, else a
+    sidecar image in the song's folder, else song_path itself (embedded art). A cover_ref of
+    "embedded:..." or "none" means the folder was already looked at, so it isn't listed again.
+    """
+    if cover_ref.startswith("file:"):
+        if os.path.isfile(cover_ref[5:]):
+            return cover_ref[5:]
+    elif cover_ref:
+        return song_path
+    folder = os.path.dirname(song_path)
+    try:
+        name = cover_file_name(os.listdir(folder))
+    except OSError:
+        name = None
+    return os.path.join(folder, name) if name else song_path
+def cover_ref_for(source, song_path):
+    """The LibraryIndex cover_ref for a cover found at source (see cover_source)."""
+    return f"embedded:{song_path}" if source == song_path else f"file:{source}"
+def read_cover(source):
+    """Raw bytes of the cover at source: a sidecar image as-is, or a track's embedded picture."""
+    if source.lower().endswith(COVER_FILE_EXTENSIONS):
+        with open(source, "rb") as f:
+            return f.read()
+    return extract_cover_data(source)
+def album_cover_sources(index):
+    """cover_source of every album in index, going by its recorded cover_ref only (no probing)."""
+    refs = index.cover_refs()
+    return [
+        refs[a[2]][5:] if refs.get(a[2], "").startswith("file:") else os.path.join(a[2], a[3])
+        for a in index.albums()
+    ]
+COVER_POOL = None
+def cover_pool():
+    """
+    Thread pool for cover work. Kept apart from QThreadPool.globalInstance(): Qt uses that
+    one for smooth image scaling on the GUI thread, and if our tasks fill it up the GUI
+    thread waits on it forever.
+    """
+    global COVER_POOL
+    if COVER_POOL is None:
+        COVER_POOL = QtCore.QThreadPool()
+        COVER_POOL.setMaxThreadCount(max(2, QtCore.QThread.idealThreadCount()))
+    return COVER_POOL
+class ThumbnailPack:
+    """
+    Many small images in one append-only file, read through mmap so a lookup is a dict hit
+    and a slice of mapped memory instead of an open/read per image. Records are
+    [20-byte sha1 key][uint32 length][bytes]; the offset index is rebuilt from the record
+    headers on open and a torn record at the end (crash mid-append) is cut off.
+    Adding a key again appends a new record; the old one is garbage until compact().
+    """
+    MAGIC = b"BSPACK1\n"
+    HEADER = struct.Struct("<20sI")
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.open()
+
+    def open(self):
+        self.offsets = {}  # key -> (offset, length) of the newest record
+        self.garbage = 0
+        self.file = open(self.path, "a+b")
+        if self.file.seek(0, os.SEEK_END) < len(self.MAGIC):
+            self.file.truncate(0)
+            self.file.write(self.MAGIC)
+            self.file.flush()
+        self.map = None
+        self.remap()
+        pos, size = len(self.MAGIC), len(self.map)
+        while pos + self.HEADER.size <= size:
+            key, length = self.HEADER.unpack_from(self.map, pos)
+            if pos + self.HEADER.size + length > size:
+                break
+            if key in self.offsets:
+                self.garbage += self.HEADER.size + self.offsets[key][1]
+            self.offsets[key] = (pos + self.HEADER.size, length)
+            pos += self.HEADER.size + length
+        if pos < size:
+            self.map.close()
+            self.file.truncate(pos)
+            self.remap()
+        self.end = pos
+
+    def remap(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.flush()
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        with self.lock:
+            self.map.close()
+            self.file.close()
+
+    def size(self):
+        return self.end
+
+    def get(self, key):
+        """The bytes stored under key (20 bytes), or None."""
+        with self.lock:
+            entry = self.offsets.get(key)
+            if entry is None:
+                return None
+            offset, length = entry
+            if offset + length > len(self.map):
+                self.remap()  # appended since the last mapping
+            return self.map[offset:offset + length]
+
+    def put(self, key, data):
+        with self.lock:
+            offset = self.end
+            self.file.write(self.HEADER.pack(key, len(data)) + data)
+            self.file.flush()
+            self.end = offset + self.HEADER.size + len(data)
+            if key in self.offsets:
+                self.garbage += self.HEADER.size + self.offsets[key][1]
+            self.offsets[key] = (offset + self.HEADER.size, len(data))
+
+    def dead_bytes(self, live_keys):
+        """Bytes taken by superseded records and records whose key isn't in live_keys."""
+        with self.lock:
+            return self.garbage + sum(self.HEADER.size + length for key, (_offset, length) in self.offsets.items()
+                                      if key not in live_keys)
+
+    def compact(self, live_keys):
+        """Rewrite the pack with only the newest record of each key in live_keys. Returns (bytes before, after)."""
+        with self.lock:
+            before = self.end
+            if len(self.map) < self.end:
+                self.remap()
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as out:
+                out.write(self.MAGIC)
+                for key, (offset, length) in self.offsets.items():
+                    if key in live_keys:
+                        out.write(self.HEADER.pack(key, length))
+                        out.write(self.map[offset:offset + length])
+            # the old file has to be unmapped and closed before it can be replaced on Windows
+            self.close()
+            os.replace(tmp, self.path)
+            self.open()
+            return before, self.size()
+
+class CoverStore:
+    """
+    Every album cover pre-scaled to COVER_SIZES and kept on disk under the sha1 of its bytes,
+    so art shared by every track or by several albums is stored once. Cover sources map to that
+    hash by path, size and mtime, so later lookups don't read the source. Callers get the variant
+    nearest the size they draw at; bigger ones are decoded when first asked for. Thread-safe.
+    """
+    def __init__(self, folder=THUMBNAIL_DIR, sizes=COVER_SIZES):
+        self.folder = folder
+        self.sizes = tuple(sorted(sizes))
+        os.makedirs(folder, exist_ok=True)
+        # the tree asks for thousands of icons, so those share one mapped file instead of one file each
+        self.pack = ThumbnailPack(os.path.join(folder, THUMBNAIL_PACK))
+        self.aliases = ThumbnailPack(os.path.join(folder, COVER_ALIASES))  # source key -> content hash
+
+    def key(self, source):
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+        ident = f"{os.path.normcase(os.path.abspath(source))}|{st.st_size}|{st.st_mtime_ns}"
+        return hashlib.sha1(ident.encode("utf-8", "surrogateescape")).hexdigest()
+
+    def content_key(self, source):
+        """Content hash of the cover stored for source, or None if it wasn't stored (or changed since)."""
+        key = self.key(source)
+        digest = self.aliases.get(bytes.fromhex(key)) if key else None
+        return digest.hex() if digest else None
+
+    def nearest(self, size):
+        """The smallest stored size that is at least size, or the largest one."""
+        return next((s for s in self.sizes if s >= size), self.sizes[-1])
+
+    def variant_path(self, content, size):
+        return os.path.join(self.folder, f"{content}_{size}.jpg")
+
+    def variant(self, content, size):
+        """The stored size variant of the cover with this content hash, or None."""
+        if size == THUMBNAIL_SIZE:
+            data = self.pack.get(bytes.fromhex(content))
+            image = QtGui.QImage.fromData(data, "PNG") if data else QtGui.QImage()
+        else:
+            image = QtGui.QImage(self.variant_path(content, size))
+        if image.isNull():
+            return None
+        image.setText(COVER_HASH_TEXT, content)
+        return image
+
+    def get(self, source, size):
+        """The stored variant nearest to size as a QImage, or None if it was never stored."""
+        content = self.content_key(source)
+        return self.variant(content, self.nearest(size)) if content else None
+
+    def put(self, source, data, up_to=None):
+        """
+        Store the cover bytes data as source's cover: every variant, or only those up to
+        nearest(up_to) (what a decode_cover for that size can fill). Returns {size: QImage},
+        or None if data isn't an image. When the same bytes were stored before, from any
+        source, their variants are read back instead of decoding data again.
+        """
+        content = hashlib.sha1(data).hexdigest()
+        key = self.key(source)
+        if key is not None and self.aliases.get(bytes.fromhex(key)) != bytes.fromhex(content):
+            self.aliases.put(bytes.fromhex(key), bytes.fromhex(content))
+        sizes = self.sizes if up_to is None else [s for s in self.sizes if s <= self.nearest(up_to)]
+        variants = {size: self.variant(content, size) for size in sizes}
+        if all(image is not None for image in variants.values()):
+            return variants
+        image = decode_cover(data, sizes[-1])
+        if image.isNull():
+            return None
+        for size in reversed(sizes):
+            # each variant is scaled from the next bigger one, never from the original twice
+            if image.width() > size or image.height() > size:
+                image = image.scaled(size, size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+            if variants[size] is not None:
+                continue
+            variants[size] = image
+            if size == THUMBNAIL_SIZE:
+                # icons stay lossless PNG; the bigger variants are photos and much smaller as JPEG
+                png = QtCore.QByteArray()
+                buffer = QtCore.QBuffer(png)
+                buffer.open(QtCore.QIODevice.WriteOnly)
+                if image.save(buffer, "PNG"):
+                    self.pack.put(bytes.fromhex(content), bytes(png))
+                continue
+            path = self.variant_path(content, size)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            # written under a temporary name so a half-written file is never picked up by get()
+            if image.save(tmp, "JPEG", 90):
+                os.replace(tmp, path)
+        for image in variants.values():
+            image.setText(COVER_HASH_TEXT, content)  # after saving, or it would end up in the files
+        return variants
+
+    def compact(self, sources):
+        """
+        Compact both packs down to the covers of sources (see album_cover_sources), each
+        once at least PACK_COMPACT_RATIO of it is garbage. Returns (bytes before, after) of
+        the thumbnail pack, or None if it was left as it is.
+        """
+        keys = {bytes.fromhex(key) for key in map(self.key, sources) if key is not None}
+        if self.aliases.dead_bytes(keys) >= PACK_COMPACT_RATIO * self.aliases.size():
+            self.aliases.compact(keys)
+        live = {self.aliases.get(key) for key in keys} - {None}
+        if self.pack.dead_bytes(live) < PACK_COMPACT_RATIO * self.pack.size():
+            return None
+        return self.pack.compact(live)
+
+    def image(self, source, size):
+        """get(), reading the cover at source and storing its variants on a miss. None if there is no cover."""
+        image = self.get(source, size)
+        if image is not None:
+            return image
+        data = read_cover(source)
+        variants = self.put(source, data, size) if data else None
+        return variants[self.nearest(size)] if variants else None
+COVER_STORE = None
+def cover_store():
+    global COVER_STORE
+    if COVER_STORE is None:
+        COVER_STORE = CoverStore()
+    return COVER_STORE
+def make_backdrop(image: QtGui.QImage) -> QtGui.QImage:
+    """
+    A blurred, darkened square of image for the now-playing background: smooth downscaling
+    to BACKDROP_BLUR_SIZE averages the cover into a few colour patches, two smooth upscales
+    (4x, then the rest) spread them out without the diamond pattern one big bilinear jump
+    leaves, and BACKDROP_DARKEN of black goes on top. Safe off the GUI thread (QImage only).
+    """
+    small = image.scaled(BACKDROP_BLUR_SIZE, BACKDROP_BLUR_SIZE, QtCore.Qt.KeepAspectRatioByExpanding,
+                         QtCore.Qt.SmoothTransformation)
+    small = small.copy((small.width() - BACKDROP_BLUR_SIZE) // 2, (small.height() - BACKDROP_BLUR_SIZE) // 2,
+                       BACKDROP_BLUR_SIZE, BACKDROP_BLUR_SIZE)
+    mid = small.scaled(BACKDROP_BLUR_SIZE * 4, BACKDROP_BLUR_SIZE * 4, QtCore.Qt.IgnoreAspectRatio,
+                       QtCore.Qt.SmoothTransformation)
+    backdrop = mid.scaled(BACKDROP_SIZE, BACKDROP_SIZE, QtCore.Qt.IgnoreAspectRatio,
+                          QtCore.Qt.SmoothTransformation).convertToFormat(QtGui.QImage.Format_RGB32)
+    painter = QtGui.QPainter(backdrop)
+    painter.fillRect(backdrop.rect(), QtGui.QColor(0, 0, 0, round(255 * BACKDROP_DARKEN)))
+    painter.end()
+    return backdrop
+class BackdropCache:
+    """
+    make_backdrop results for the last BACKDROP_CACHE_ALBUMS covers, least recently used
+    dropped first. Keyed by cover_hash, so a changed cover just misses and albums sharing
+    art share a backdrop. Thread-safe.
+    """
+    def __init__(self, capacity=BACKDROP_CACHE_ALBUMS):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, image=None):
+        """The backdrop for key; made from image (and kept) on a miss if it's given, else None."""
+        with self.lock:
+            backdrop = self.items.get(key)
+            if backdrop is not None:
+                self.items.move_to_end(key)
+                return backdrop
+        if image is None:
+            return None
+        backdrop = make_backdrop(image)
+        with self.lock:
+            self.items[key] = backdrop
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+        return backdrop
+class PixmapCache:
+    """
+    Decoded cover pixmaps for the GUI thread (QPixmap isn't usable anywhere else), keyed by
+    (cover_hash, width, height) and kept within budget bytes: the least recently used go first
+    once it's exceeded. Widgets showing a pixmap keep it alive themselves (QPixmap is implicitly
+    shared), so this bounds what is held for reuse, not what's on screen. hits, misses and
+    evictions count from creation; stats() reports them with the current size.
+    """
+    def __init__(self, budget=PIXMAP_CACHE_BYTES):
+        self.budget = budget
+        self.items = OrderedDict()  # key -> (QPixmap, bytes)
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, load=None):
+        """The pixmap under key; on a miss the result of load() (if given) is kept and returned."""
+        entry = self.items.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        pixmap = load() if load is not None else None
+        if pixmap is not None and not pixmap.isNull():
+            self.put(key, pixmap)
+        return pixmap
+
+    def put(self, key, pixmap):
+        if key in self.items:
+            self.bytes -= self.items.pop(key)[1]
+        nbytes = pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+        self.items[key] = (pixmap, nbytes)
+        self.bytes += nbytes
+        while self.bytes > self.budget and len(self.items) > 1:
+            _key, (_pixmap, evicted) = self.items.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def stats(self):
+        return {"entries": len(self.items), "bytes": self.bytes, "budget": self.budget,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+PIXMAP_CACHE = None
+def pixmap_cache():
+    global PIXMAP_CACHE
+    if PIXMAP_CACHE is None:
+        PIXMAP_CACHE = PixmapCache()
+    return PIXMAP_CACHE
+BACKDROP_CACHE = None
+def backdrop_cache():
+    global BACKDROP_CACHE
+    if BACKDROP_CACHE is None:
+        BACKDROP_CACHE = BackdropCache()
+    return BACKDROP_CACHE
 class CoverArtTaskNotifier(QtCore.QObject):
+    batch = QtCore.pyqtSignal(list)
     finished = QtCore.pyqtSignal(list)
     log = QtCore.pyqtSignal(str)
 class CoverArtExtractionTask(QtCore.QRunnable):
     """
     A QRunnable task that extracts cover art for a list of albums.
-    Each album is a 4-tuple: (artist, album, album_path, first_audio).
-    The result is a list of 5-tuples: (artist, album, album_path, first_audio, cover)
+    Takes (artist, album, album_path, first_audio) tuples and yields the same plus the
+    cover_hash of the THUMBNAIL_SIZE variant (or None), streamed through notifier.batch.
+    With a LibraryIndex, known coverless albums are skipped and new cover refs and palettes
+    recorded (cover_refs/palettes: a shared snapshot). Albums wanted() turns down are dropped.
     """
-    def __init__(self, albums, notifier):
+    def __init__(self, albums, notifier, index=None, cover_refs=None, wanted=None, palettes=None):
         super().__init__()
         self.albums = albums
         self.notifier = notifier
+        self.index = index
+        self.cover_refs = cover_refs
+        self.wanted = wanted
+        self.palettes = palettes
 
     @QtCore.pyqtSlot()
     def run(self):
         enriched_albums = []
+        batch_start = 0
+        cover_refs = self.cover_refs
+        if cover_refs is None:
+            cover_refs = self.index.cover_refs() if self.index else {}
+        palettes = self.palettes
+        if palettes is None:
+            palettes = self.index.palettes() if self.index else {}
+        store = cover_store()
+        new_refs = []
+        new_palettes = []
         for album in self.albums:
             artist, album_name, album_path, first_audio = album
+            if self.wanted is not None and not self.wanted(album_path):
+                continue
+            # tag-driven albums carry an absolute first_audio, which join() returns as-is
             first_audio_path = os.path.join(album_path, first_audio)
             cover = None
-            try:
-                audio = ID3(first_audio_path)
-                for tag in audio.values():
-                    if isinstance(tag, APIC):
-                        cover_data = tag.data
-                        pixmap = QtGui.QPixmap()
-                        if pixmap.loadFromData(cover_data):
-                            cover = pixmap
+            if cover_refs.get(album_path) != "none":
+                source = cover_source(first_audio_path, cover_refs.get(album_path, ""))
+                cover = store.get(source, THUMBNAIL_SIZE)
+                try:
+                    if cover is None:
+                        data = read_cover(source)
+                        variants = store.put(source, data, THUMBNAIL_SIZE) if data else None
+                        if variants:
+                            cover = variants[THUMBNAIL_SIZE]
                             self.notifier.log.emit(f"[DEBUG] Extracted cover for {album_name}")
-                            break
-            except Exception as e:
-                self.notifier.log.emit(f"[DEBUG] Exception for {album_name}: {e}")
-            if not cover:
-                cover = QtGui.QPixmap(resource_path("plit.png"))
-            enriched_albums.append((artist, album_name, album_path, first_audio, cover))
+                except Exception as e:
+                    self.notifier.log.emit(f"[DEBUG] Exception for {album_name}: {e}")
+                ref = cover_ref_for(source, first_audio_path) if cover else "none"
+                if cover_refs.get(album_path) != ref:
+                    new_refs.append((album_path, ref))
+                if cover is not None and (album_path not in palettes or cover_refs.get(album_path) != ref):
+                    new_palettes.append((album_path, cover_palette(cover)))
+            enriched_albums.append((artist, album_name, album_path, first_audio, cover_hash(cover)))
+            if len(enriched_albums) - batch_start >= COVER_BATCH_SIZE:
+                self.notifier.batch.emit(enriched_albums[batch_start:])
+                batch_start = len(enriched_albums)
+        if enriched_albums[batch_start:]:
+            self.notifier.batch.emit(enriched_albums[batch_start:])
+        if self.index and new_refs:
+            self.index.set_cover_refs(new_refs)
+        if self.index and new_palettes:
+            self.index.set_palettes(new_palettes)
         self.notifier.finished.emit(enriched_albums)
+class CoverDecodeNotifier(QtCore.QObject):
+    # request id, QImage or None, cover_palette or None, make_backdrop QImage or None
+    decoded = QtCore.pyqtSignal(int, object, object, object)
+
+class CoverDecodeTask(QtCore.QRunnable):
+    """
+    Fetches song_path's cover from the CoverStore scaled to fit size, off the GUI thread, and
+    emits it (or None) with the album's palette and backdrop through notifier.decoded.
+    request_id lets the GUI drop answers to requests it has moved on from. The cover_ref and
+    palette come from index under album_key; a missing palette is computed and stored there.
+    """
+    def __init__(self, song_path, size, notifier, request_id, index=None, album_key=None):
+        super().__init__()
+        self.song_path = song_path
+        self.size = size
+        self.notifier = notifier
+        self.request_id = request_id
+        self.index = index
+        self.album_key = album_key
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        image = palette = backdrop = None
+        try:
+            store = cover_store()
+            cover_ref = self.index.cover_ref(self.album_key) if self.index and self.album_key else ""
+            source = cover_source(self.song_path, cover_ref)
+            image = store.image(source, max(self.size.width(), self.size.height()))
+            if image is not None:
+                backdrop = backdrop_cache().get(cover_hash(image), image)
+                if self.index and self.album_key:
+                    palette = self.index.palette(self.album_key)
+                if palette is None:
+                    palette = cover_palette(store.get(source, 0))
+                    if self.index and self.album_key and palette:
+                        self.index.set_palettes([(self.album_key, palette)])
+                image = image.scaled(self.size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+        except Exception as e:
+            print(f"[DEBUG] CoverDecodeTask: {self.song_path}: {e}")
+        try:
+            self.notifier.decoded.emit(self.request_id, image, palette, backdrop)
+        except RuntimeError:
+            pass  # the window closed while this was decoding
+
+class PackCompactionTask(QtCore.QRunnable):
+    """Compacts the CoverStore's thumbnail pack down to the albums in the index, at low priority."""
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        thread = QtCore.QThread.currentThread()
+        thread.setPriority(QtCore.QThread.LowPriority)
+        try:
+            result = cover_store().compact(album_cover_sources(self.index))
+            if result:
+                print(f"[DEBUG] Thumbnail pack compacted: {result[0]} -> {result[1]} bytes")
+        except Exception as e:
+            print(f"[DEBUG] Thumbnail pack compaction failed: {e}")
+        finally:
+            thread.setPriority(QtCore.QThread.NormalPriority)
+
+class CoverArtJob(QtCore.QObject):
+    """
+    Cover extraction for many albums at once: the list is cut into COVER_CHUNK_SIZE chunks,
+    one CoverArtExtractionTask each, all on cover_pool() (not the global pool, see there),
+    so every core decodes. batch(list) streams 5-tuples from whichever chunk produced them
+    and finished(list) carries all 5-tuples in the original album order. Chunks are queued
+    at priority, earlier chunks first; wanted is passed on to every CoverArtExtractionTask.
+    """
+    batch = QtCore.pyqtSignal(list)
+    finished = QtCore.pyqtSignal(list)
+    log = QtCore.pyqtSignal(str)
+
+    def __init__(self, albums, index=None, parent=None, chunk_size=COVER_CHUNK_SIZE, priority=0, wanted=None):
+        super().__init__(parent)
+        chunk_size = max(1, chunk_size)
+        self.chunks = [albums[i:i + chunk_size] for i in range(0, len(albums), chunk_size)]
+        self.results = [None] * len(self.chunks)
+        self.index = index
+        self.priority = priority
+        self.wanted = wanted
+        self.total = len(albums)
+        self.done = 0
+        self.started = time.perf_counter()
+
+    def start(self):
+        if not self.chunks:
+            QtCore.QTimer.singleShot(0, lambda: self.finished.emit([]))
+            return
+        cover_refs = self.index.cover_refs() if self.index else {}
+        palettes = self.index.palettes() if self.index else {}
+        for i, chunk in enumerate(self.chunks):
+            notifier = CoverArtTaskNotifier(self)
+            notifier.log.connect(self.log)
+            notifier.batch.connect(self.batch)
+            notifier.finished.connect(partial(self.on_chunk_finished, i, notifier))
+            task = CoverArtExtractionTask(chunk, notifier, self.index, cover_refs, self.wanted, palettes)
+            # QThreadPool runs higher priorities first, so the first chunk gets the highest
+            cover_pool().start(task, self.priority + len(self.chunks) - i)
+
+    def on_chunk_finished(self, i, notifier, albums):
+        notifier.deleteLater()
+        self.results[i] = albums
+        self.done += len(albums)
+        if all(r is not None for r in self.results):
+            self.log.emit(f"[DEBUG] Covers for {self.done}/{self.total} albums in {time.perf_counter() - self.started:.2f}s "
+                          f"({len(self.chunks)} chunks on {cover_pool().maxThreadCount()} threads)")
+            self.finished.emit([album for chunk in self.results for album in chunk])
+
 class LyricsWidget(QtWidgets.QTextBrowser):
     from PyQt5.QtCore import pyqtSignal, QUrl
     timestampClicked = pyqtSignal(int)
@@ -226,27 +1073,181 @@ class AlbumTree(QtWidgets.QTreeWidget):
         self.setWordWrap(True)
         self.setTextElideMode(QtCore.Qt.ElideNone)
         self.setIconSize(QtCore.QSize(120, 120))
+        self.artist_items = {}
+        self.album_items = {}
+        self.placeholder_icon = None
+        # covers are loaded lazily for the rows on screen, see request_visible_covers
+        self.library_index = None
+        self.cover_albums = {}  # album_path -> 4-tuple, what a CoverArtExtractionTask needs
+        self.covers_loaded = set()
+        self.covers_wanted = set()  # on screen and not loaded; tasks skip anything not in here
+        self.covers_inflight = set()
+        self.cover_generation = 0
+        self.cover_timer = QtCore.QTimer(self)
+        self.cover_timer.setSingleShot(True)
+        self.cover_timer.setInterval(COVER_REQUEST_DELAY_MS)
+        self.cover_timer.timeout.connect(self.request_visible_covers)
+        self.verticalScrollBar().valueChanged.connect(self.cover_timer.start)
+        self.itemExpanded.connect(self.cover_timer.start)
+        self.itemCollapsed.connect(self.release_covers)
     def populate_albums_data(self, albums_data):
         self.clear()
+        self.artist_items = {}
+        self.album_items = {}
         for album in albums_data:
             #note to self; 5-tuple: artist, album, album_path, first_audio, cover
             artist, album_name, album_path, first_audio, cover = album
-            artist_items = self.findItems(artist, QtCore.Qt.MatchExactly)
-            if artist_items:
-                artist_item = artist_items[0]
-            else:
+            artist_item = self.artist_items.get(artist)
+            if artist_item is None:
                 artist_item = QtWidgets.QTreeWidgetItem(self)
                 artist_item.setText(0, artist)
                 artist_item.setExpanded(False)
+                self.artist_items[artist] = artist_item
             album_item = QtWidgets.QTreeWidgetItem(artist_item)
-            album_item.setText(0, album_name)
-            album_item.setData(0, QtCore.Qt.UserRole, album_path)
-            if cover:
-                album_icon = QtGui.QIcon(fill_square_pixmap(cover, 32))
-                album_item.setIcon(0, album_icon)
+            self.set_album_item(album_item, album)
+            self.album_items[album_path] = album_item
+    def set_album_item(self, album_item, album):
+        artist, album_name, album_path, first_audio, cover = album
+        album_item.setText(0, album_name)
+        album_item.setData(0, QtCore.Qt.UserRole, album_path)
+        self.cover_albums[album_path] = (artist, album_name, album_path, first_audio)
+        if cover:
+            # albums sharing art (same cover_hash) share the pixmap
+            cover = pixmap_cache().get((cover, THUMBNAIL_SIZE, THUMBNAIL_SIZE), partial(self.load_icon_pixmap, cover))
+        if cover:
+            album_item.setIcon(0, QtGui.QIcon(cover))
+        else:
+            if self.placeholder_icon is None:
+                self.placeholder_icon = QtGui.QIcon(QtGui.QPixmap(resource_path("plit.png")))
+            album_item.setIcon(0, self.placeholder_icon)
+    @staticmethod
+    def load_icon_pixmap(content):
+        image = cover_store().variant(content, THUMBNAIL_SIZE)
+        return fill_square_pixmap(QtGui.QPixmap.fromImage(image), 32) if image is not None else None
+    def apply_album_diff(self, diff):
+        """
+        Patch rows in place from an IndexerWorker rescan diff instead of repopulating.
+        "added"/"modified" hold 5-tuples (cover is a cover_hash or None), "removed" album paths.
+        """
+        self.setUpdatesEnabled(False)
+        try:
+            for album_path in diff.get("removed", []):
+                album_item = self.album_items.pop(album_path, None)
+                self.cover_albums.pop(album_path, None)
+                self.covers_loaded.discard(album_path)
+                if album_item is None:
+                    continue
+                artist_item = album_item.parent()
+                artist_item.removeChild(album_item)
+                if artist_item.childCount() == 0:
+                    self.takeTopLevelItem(self.indexOfTopLevelItem(artist_item))
+                    self.artist_items.pop(artist_item.text(0), None)
+            for album in diff.get("modified", []) + diff.get("added", []):
+                artist, album_name, album_path = album[:3]
+                album_item = self.album_items.get(album_path)
+                if album_item is not None:
+                    # the cover may have changed with the files, load it again when it's on screen
+                    self.covers_loaded.discard(album_path)
+                    self.set_album_item(album_item, album)
+                    continue
+                artist_item = self.artist_items.get(artist)
+                if artist_item is None:
+                    artist_item = QtWidgets.QTreeWidgetItem()
+                    artist_item.setText(0, artist)
+                    row = self.sorted_insert_row(self.topLevelItemCount(), self.topLevelItem, artist)
+                    self.insertTopLevelItem(row, artist_item)
+                    self.artist_items[artist] = artist_item
+                album_item = QtWidgets.QTreeWidgetItem()
+                self.set_album_item(album_item, album)
+                row = self.sorted_insert_row(artist_item.childCount(), artist_item.child, album_name)
+                artist_item.insertChild(row, album_item)
+                self.album_items[album_path] = album_item
+        finally:
+            self.setUpdatesEnabled(True)
+        self.cover_timer.start()
+    @staticmethod
+    def sorted_insert_row(count, item_at, text):
+        """Row to insert text at among count natural-sorted siblings (item_at(row) -> item)."""
+        key = natural_sort_key(text)
+        if count == 0 or natural_sort_key(item_at(count - 1).text(0)) <= key:
+            return count  # albums mostly arrive in order, so this is the common case
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if natural_sort_key(item_at(mid).text(0)) < key:
+                lo = mid + 1
             else:
-                default_icon = QtGui.QIcon(QtGui.QPixmap(resource_path("plit.png")))
-                album_item.setIcon(0, default_icon)
+                hi = mid
+        return lo
+    def add_albums(self, albums):
+        """Insert a batch of 4-tuples streamed from IndexerWorker; covers come later via update_album_covers."""
+        self.apply_album_diff({"added": [tuple(album[:4]) + (None,) for album in albums]})
+    def update_album_covers(self, albums):
+        for album in albums:
+            album_item = self.album_items.get(album[2])
+            self.covers_inflight.discard(album[2])
+            if album_item is not None and album[2] in self.covers_wanted:
+                self.covers_wanted.discard(album[2])
+                self.covers_loaded.add(album[2])
+                self.set_album_item(album_item, album)
+    def visible_album_paths(self, extra_rows=0):
+        """Album paths of the rows in the viewport (plus extra_rows below it), top to bottom."""
+        paths = []
+        item = self.itemAt(0, 0)
+        height = self.viewport().height()
+        while item is not None and extra_rows >= 0:
+            if self.visualItemRect(item).top() >= height:
+                extra_rows -= 1
+            if item.parent() is not None:
+                paths.append(item.data(0, QtCore.Qt.UserRole))
+            item = self.itemBelow(item)
+        return paths
+    def request_visible_covers(self):
+        """
+        Ask for the covers of the albums on screen, top rows first. Covers that scrolled away
+        before their task got to them are dropped (see CoverArtExtractionTask.wanted).
+        """
+        on_screen = self.visible_album_paths(COVER_PREFETCH_ROWS)
+        if len(self.covers_loaded) > COVER_KEEP_LOADED:
+            self.release_covers_except(set(on_screen))
+        visible = [p for p in on_screen if p not in self.covers_loaded]
+        # updated in place: running tasks hold a reference to this set
+        self.covers_wanted.intersection_update(visible)
+        self.covers_wanted.update(visible)
+        todo = [self.cover_albums[p] for p in visible if p not in self.covers_inflight and p in self.cover_albums]
+        if not todo:
+            return
+        self.covers_inflight.update(album[2] for album in todo)
+        self.cover_generation += 1
+        # newer requests outrank whatever is still queued from earlier scroll positions
+        job = CoverArtJob(todo, self.library_index, parent=self, chunk_size=max(1, len(todo) // cover_pool().maxThreadCount()),
+                          priority=self.cover_generation * 1000, wanted=self.covers_wanted.__contains__)
+        job.batch.connect(self.update_album_covers)
+        job.finished.connect(partial(self.on_cover_job_finished, job, [album[2] for album in todo]))
+        job.start()
+    def on_cover_job_finished(self, job, album_paths, _albums):
+        job.deleteLater()
+        print(f"[DEBUG] Pixmap cache: {pixmap_cache().stats()}")
+        self.covers_inflight.difference_update(album_paths)
+        if any(p in self.covers_wanted for p in album_paths):
+            # some were skipped while off screen and are back now
+            self.cover_timer.start()
+    def release_covers(self, artist_item):
+        """Collapsed artists go back to placeholder icons so memory follows what's on screen."""
+        for j in range(artist_item.childCount()):
+            self.release_cover(artist_item.child(j).data(0, QtCore.Qt.UserRole))
+        self.cover_timer.start()
+    def release_covers_except(self, keep):
+        for album_path in list(self.covers_loaded - keep):
+            self.release_cover(album_path)
+    def release_cover(self, album_path):
+        album_item = self.album_items.get(album_path)
+        if album_path in self.covers_loaded and album_item is not None:
+            self.covers_loaded.discard(album_path)
+            self.set_album_item(album_item, self.cover_albums[album_path] + (None,))
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.cover_timer.start()
     def filter_albums(self, query):
         query = query.lower()
         for i in range(self.topLevelItemCount()):
@@ -261,6 +1262,7 @@ class AlbumTree(QtWidgets.QTreeWidget):
                 if match:
                     artist_visible = True
             artist_item.setHidden(not artist_visible)
+        self.cover_timer.start()
     def startDrag(self, supportedActions):
         item = self.currentItem()
         if item and item.parent() is not None:
@@ -297,6 +1299,23 @@ class NowPlayingWidget(QtWidgets.QWidget):
         layout.addWidget(self.songLabel)
         layout.addWidget(self.progressSlider)
         layout.addWidget(self.timeLabel)
+        self.backdrop = None  # QPixmap of make_backdrop, or None for the plain window colour
+        self.scaled_backdrop = None  # backdrop cropped and scaled to the widget, made on first paint
+    def set_backdrop(self, image):
+        self.backdrop = QtGui.QPixmap.fromImage(image) if image is not None else None
+        self.scaled_backdrop = None
+        self.update()
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.scaled_backdrop = None
+    def paintEvent(self, event):
+        if self.backdrop is None:
+            return super().paintEvent(event)
+        if self.scaled_backdrop is None or self.scaled_backdrop.size() != self.size():
+            scaled = self.backdrop.scaled(self.size(), QtCore.Qt.KeepAspectRatioByExpanding, QtCore.Qt.SmoothTransformation)
+            self.scaled_backdrop = scaled.copy((scaled.width() - self.width()) // 2, (scaled.height() - self.height()) // 2,
+                                               self.width(), self.height())
+        QtGui.QPainter(self).drawPixmap(0, 0, self.scaled_backdrop)
     def dragEnterEvent(self, event):
         if event.mimeData().hasText():
             event.acceptProposedAction()
@@ -392,37 +1411,102 @@ class PlaylistShelf(QtWidgets.QDockWidget):
         if hasattr(self.parent(), "play_playlist"):
             self.parent().play_playlist(self.current_playlist)
 class SearchWorker(QtCore.QThread):
-    progress = QtCore.pyqtSignal(int)
-    result = QtCore.pyqtSignal(str)
+    """
+    One Ctrl+F query off the GUI thread: through the TrackSearchIndex when there is one
+    (refining within, an earlier broader result, if given), else by filename in sqlite.
+    found(object) carries the results, unless cancel() was called first.
+    """
+    found = QtCore.pyqtSignal(object)
 
-    def __init__(self, root_folder, query):
+    def __init__(self, search_index, library_index, query, within=None):
         super().__init__()
-        self.root = root_folder
-        self.query = query.lower()
+        self.search_index = search_index
+        self.library_index = library_index
+        self.query = query
+        self.within = within
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
 
     def run(self):
-        total = 0
-        for _root, _dirs, files in os.walk(self.root):
-            total += sum(1 for f in files if f.lower().endswith(SUPPORTED_FORMATS))
-        if total == 0:
-            self.progress.emit(100)
+        started = time.perf_counter()
+        if self.search_index is not None:
+            results = self.search_index.search_docs(self.query, self.within, lambda: self.cancelled)
+        else:
+            results = self.library_index.search_filenames(self.query)
+        if results is None or self.cancelled:
             return
+        how = "refined" if self.within is not None else "indexed" if self.search_index is not None else "sqlite"
+        print(f"[DEBUG] Search {self.query!r} ({how}): {len(results)} matches in {(time.perf_counter() - started) * 1000:.1f} ms")
+        self.found.emit(results)
+
+def index_runs(indices):
+    """Ascending indices grouped into (start, end) half-open runs of consecutive numbers."""
+    runs = []
+    for i in indices:
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+class SearchResultsModel(QtCore.QAbstractListModel):
+    """
+    Ctrl+F results: TrackSearchIndex document numbers (or plain paths from the sqlite fallback),
+    only turned into paths for the rows on screen. A new result from the same index is applied
+    as runs of row removals/insertions, so the view keeps its place; past MAX_RUNS runs a single
+    reset is cheaper.
+    """
+    MAX_RUNS = 64
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.items = []
+        self.search_index = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        item = self.items[index.row()]
+        return self.search_index.path(item) if self.search_index is not None else item
+
+    def set_results(self, items, search_index):
+        if search_index is None or search_index is not self.search_index or not self.apply_diff(items):
+            self.beginResetModel()
+            self.items = list(items)
+            self.search_index = search_index
+            self.endResetModel()
+
+    def apply_diff(self, items):
+        """Turn self.items into items (both in document order); False if that takes too many runs."""
+        keep, had = set(items), set(self.items)
+        removed = index_runs(i for i, item in enumerate(self.items) if item not in keep)
+        added = index_runs(i for i, item in enumerate(items) if item not in had)
+        if len(removed) + len(added) > self.MAX_RUNS:
+            return False
+        # bottom-up so earlier runs keep their row numbers; what's left is in final order
+        for start, end in reversed(removed):
+            self.beginRemoveRows(QtCore.QModelIndex(), start, end - 1)
+            del self.items[start:end]
+            self.endRemoveRows()
+        for start, end in added:
+            self.beginInsertRows(QtCore.QModelIndex(), start, end - 1)
+            self.items[start:start] = items[start:end]
+            self.endInsertRows()
+        return True
 
-        seen = 0
-        for dirpath, _dirs, files in os.walk(self.root):
-            for f in files:
-                if not f.lower().endswith(SUPPORTED_FORMATS):
-                    continue
-                seen += 1
-                pct = int(seen / total * 100)
-                self.progress.emit(pct)
-                if self.query in f.lower():
-                    full_path = os.path.join(dirpath, f)
-                    self.result.emit(full_path)
-        self.progress.emit(100)
 class SearchSongDialog(QtWidgets.QDialog):
+    """
+    Ctrl+F. Searches as you type: keystrokes are debounced, a new query cancels the one still
+    running, and a query that narrows the last answered one only re-checks that one's matches.
+    """
     searchRequested = QtCore.pyqtSignal(str, object)
     songSelected = QtCore.pyqtSignal(str)
+    DEBOUNCE_MS = 150
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -441,35 +1525,91 @@ class SearchSongDialog(QtWidgets.QDialog):
         self.count.setText("Songs Found: 0")
         self.layout().addWidget(self.count)
 
-        self.results = QtWidgets.QListWidget(self)
+        self.model = SearchResultsModel(self)
+        self.results = QtWidgets.QListView(self)
+        self.results.setModel(self.model)
+        self.results.setUniformItemSizes(True)
         self.results.setStyleSheet("color: white")
         self.layout().addWidget(self.results)
 
-        self.input.returnPressed.connect(self.on_return)
-        self.results.itemDoubleClicked.connect(self.on_item_double)
+        self.debounce = QtCore.QTimer(self)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(self.DEBOUNCE_MS)
+        self.debounce.timeout.connect(self.start_search)
+        self.input.textChanged.connect(self.on_text_changed)
+        self.input.returnPressed.connect(self.start_search)
+        self.results.doubleClicked.connect(self.on_item_double)
+        self.query = ""
         self.worker = None
+        self.workers = set()  # every worker not finished yet, cancelled ones included
+        self.last_query = None  # last answered query, its results and the index they came from
+        self.last_results = None
+        self.last_index = None
+
+    def on_text_changed(self, _text):
+        self.debounce.start()
 
-    def on_return(self):
+    def start_search(self):
+        self.debounce.stop()
         query = self.input.text().strip()
+        if query == self.query:
+            return
+        self.query = query
+        self.cancel_search()
         if not query:
+            self.model.set_results([], None)
+            self.on_search_finished()
             return
-        self.results.clear()
-        self.progressBar.setValue(0)
+        self.progressBar.setRange(0, 0)
         self.searchRequested.emit(query, self)
 
+    def refine_from(self, query, search_index):
+        """The last results if query narrows their query on the same index, else None (search everything)."""
+        if search_index is not None and self.last_index is search_index and TrackSearchIndex.narrows(query, self.last_query):
+            return self.last_results
+        return None
+
+    def cancel_search(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+
     def set_worker(self, worker):
         self.worker = worker
+        self.workers.add(worker)
+        worker.found.connect(partial(self.on_search_results, worker))
+        worker.finished.connect(partial(self.on_worker_finished, worker))
+
+    def on_search_results(self, worker, results):
+        if worker is not self.worker:
+            return
+        self.last_query, self.last_results, self.last_index = worker.query, results, worker.search_index
+        self.model.set_results(results, worker.search_index)
+        self.on_search_finished()
 
-    def add_result(self, song_path):
-        self.results.addItem(song_path)
+    def on_worker_finished(self, worker):
+        worker.wait()
+        self.workers.discard(worker)
+        worker.deleteLater()
+        if worker is self.worker:
+            self.worker = None
+            self.on_search_finished()
 
     def on_search_finished(self):
-        self.worker = None
-        self.setWindowTitle("Find Song: " + str(self.results.count()))
-        self.count.setText("Songs Found: " + str(self.results.count()))
+        self.progressBar.setRange(0, 100)
+        self.progressBar.setValue(100 if self.query else 0)
+        self.setWindowTitle("Find Song: " + str(self.model.rowCount()))
+        self.count.setText("Songs Found: " + str(self.model.rowCount()))
+
+    def done(self, result):
+        self.debounce.stop()
+        self.cancel_search()
+        for worker in list(self.workers):
+            worker.wait()
+        super().done(result)
 
-    def on_item_double(self, item):
-        self.songSelected.emit(item.text())
+    def on_item_double(self, index):
+        self.songSelected.emit(self.model.data(index))
         self.accept()
 class SettingsDialog(QtWidgets.QDialog):
     def __init__(self, parent=None):
@@ -547,12 +1687,28 @@ class VinylPlayer(QtWidgets.QMainWindow):
         self.is_paused = False
         self.current_tracks = []
         self.current_album_path = None
+        self.current_album_key = None
         self.repeat_mode = 0
         self.random_shuffle_active = False
         self.album_shuffle_active = False
         self.original_tracks = None
         self.current_song = ""
         self.playlists = {}  # managed by PlaylistShelf
+        self.library_index = None  # set once indexing finishes
+        self.library_roots = []  # [{"path", "workers", "rescan_minutes"}], see load_library_roots
+        self.tag_mode = False
+        self.rescan_workers = {}
+        self.rescan_pending = {}  # root path -> (dirty paths, check_files, paced) to rescan once its running rescan ends
+        self.rescan_timers = []
+        self.rescan_budgets = {}  # root path -> (IOBudget, st_dev of the root)
+        self.watch_dirs = {}  # root path -> directories LibraryWatcher watches there, from the last scan of it
+        self.playback_device = (None, None)  # (album path, st_dev) of what's playing
+        self.library_watcher = None
+        self.indexer_workers = []
+        self.track_table = None  # TrackTable snapshot of the index, rebuilt after every scan
+        self.track_table_worker = None
+        self.track_table_stale = False
+        self.search_index = None  # TrackSearchIndex over track_table, for Ctrl+F
 
         main_splitter = QtWidgets.QSplitter(QtCore.Qt.Horizontal)
         self.setCentralWidget(main_splitter)
@@ -629,6 +1785,11 @@ class VinylPlayer(QtWidgets.QMainWindow):
         self.media_list_player.set_media_player(self.player)
         self.media_list_player.set_media_list(self.media_list)
         self.current_album_cover = None
+        self.current_palette = None  # cover_palette the window is themed with
+        self.text_color = self.palette().color(QtGui.QPalette.WindowText)  # until a cover sets it
+        self.cover_request = 0  # id of the latest CoverDecodeTask; older answers are ignored
+        self.cover_decoder = CoverDecodeNotifier(self)
+        self.cover_decoder.decoded.connect(self.on_album_cover_decoded)
 
         # Lyrics dock
         self.lyricsWidget = LyricsWidget(self)
@@ -639,6 +1800,11 @@ class VinylPlayer(QtWidgets.QMainWindow):
         toggleLyricsAction = self.lyricsDock.toggleViewAction()
         self.menuBar().addAction(toggleLyricsAction)
 
+        rescanAction = QtWidgets.QAction("Rescan Library", self)
+        rescanAction.setShortcut(QtGui.QKeySequence("F5"))
+        rescanAction.triggered.connect(lambda: self.rescan_library(check_files=True, paced=False))
+        self.menuBar().addAction(rescanAction)
+
         settingsAction = QtWidgets.QAction("Settings", self)
         settingsAction.triggered.connect(self.open_settings_dialog)
         self.menuBar().addAction(settingsAction)
@@ -708,6 +1874,183 @@ class VinylPlayer(QtWidgets.QMainWindow):
         else:
             mins, secs = divmod(int(remaining.total_seconds()), 60)
             self.setWindowTitle(f"Sleeping in {mins:02}:{secs:02}")
+    def log_message(self, message):
+        print(message if message.startswith("[DEBUG]") else f"[DEBUG] {message}")
+        if self.indexer_workers:
+            self.statusBar().showMessage(message)
+
+    def index_library(self):
+        """
+        Fill the tree from the index straight away, then bring every root up to date: roots the
+        index already knows get a rescan (only what changed is re-read), new ones a full scan whose
+        albums stream into the tree. Covers load as rows come on screen.
+        """
+        self.albumTree.library_index = self.library_index
+        # every root gets its own worker (and thread pool size) so separate drives are walked at the same time
+        for root in self.library_roots:
+            # albums indexed in the other mode (folder vs tag) don't count, that root needs a full scan
+            known = [a for a in self.library_index.albums(root["path"]) if is_tag_album(a[2]) == self.tag_mode]
+            if known:
+                self.albumTree.add_albums(known)
+            worker = IndexerWorker(root["path"], self.library_index, rescan=bool(known), workers=root["workers"],
+                                   tag_mode=self.tag_mode)
+            worker.log.connect(self.log_message)
+            worker.batch.connect(self.on_index_batch)
+            worker.diff.connect(self.on_rescan_diff)
+            worker.moved.connect(self.on_tracks_moved)
+            worker.finished.connect(partial(self.on_index_finished, worker))
+            self.indexer_workers.append(worker)
+        if not self.indexer_workers:
+            self.on_index_finished(None, [])
+        for worker in list(self.indexer_workers):
+            worker.start()
+
+    def on_index_batch(self, albums):
+        self.albumTree.add_albums(albums)
+        if self.searchBox.text():
+            self.albumTree.filter_albums(self.searchBox.text())
+
+    def on_index_finished(self, worker, _albums):
+        if worker is not None:
+            self.indexer_workers.remove(worker)
+            # finished is emitted from inside run(); let the thread actually end before it's deleted
+            worker.wait()
+            self.watch_dirs[worker.tracks_folder] = worker.watch_dirs
+            worker.deleteLater()
+        if self.indexer_workers:
+            return
+        self.statusBar().showMessage(f"{len(self.albumTree.album_items)} albums indexed", 5000)
+        self.start_library_watcher()
+        # covers are loaded by the tree itself, for whatever rows are on screen
+        self.albumTree.request_visible_covers()
+        if self.library_index is not None:
+            cover_pool().start(PackCompactionTask(self.library_index), -1)
+        self.load_track_table()
+
+    def load_track_table(self):
+        if self.library_index is None:
+            return
+        if self.track_table_worker is not None:
+            self.track_table_stale = True
+            return
+        self.track_table_worker = TrackTableWorker(self.library_index)
+        self.track_table_worker.finished.connect(self.on_track_table_loaded)
+        self.track_table_worker.start()
+
+    def on_track_table_loaded(self, table, search_index):
+        self.track_table_worker.wait()
+        self.track_table_worker.deleteLater()
+        self.track_table_worker = None
+        self.track_table = table
+        self.search_index = search_index
+        print(f"[DEBUG] Track table: {len(table)} tracks, {table.nbytes() / 1e6:.1f} MB")
+        if self.track_table_stale:
+            self.track_table_stale = False
+            self.load_track_table()
+
+    def watched_directories(self):
+        return set().union(*self.watch_dirs.values())
+
+    def start_library_watcher(self):
+        self.library_watcher = LibraryWatcher(self)
+        self.library_watcher.rescanRequested.connect(self.on_watcher_changes)
+        self.library_watcher.set_directories(self.watched_directories())
+        for root in self.library_roots:
+            if root.get("rescan_minutes", 0) > 0:
+                timer = QtCore.QTimer(self)
+                timer.setInterval(int(root["rescan_minutes"] * 60 * 1000))
+                timer.timeout.connect(partial(self.rescan_library, None, [root["path"]], True))
+                timer.start()
+                self.rescan_timers.append(timer)
+
+    def on_watcher_changes(self, dirty_paths):
+        if not dirty_paths:
+            # polling fallback: nothing specific, check every root
+            self.rescan_library()
+            return
+        roots = {library_root_of(path, self.library_roots) for path in dirty_paths} - {None}
+        self.rescan_library(dirty_paths, sorted(roots))
+
+    def rescan_library(self, dirty_paths=None, root_paths=None, check_files=False, paced=True):
+        """
+        check_files (F5, rescan_minutes) also catches files edited in place (see LibraryScanner.rescan).
+        paced=False (F5, someone is waiting) skips the root's IOBudget; it still runs at idle priority.
+        """
+        if self.library_index is None or not self.library_roots:
+            return
+        for root in self.library_roots:
+            if root_paths is not None and root["path"] not in root_paths:
+                continue
+            if root["path"] in self.rescan_workers:
+                # a rescan of this root is already running; run once more afterwards with everything that piled up
+                if root["path"] in self.rescan_pending:
+                    pending, pending_check, pending_paced = self.rescan_pending[root["path"]]
+                    # no paths means "check everything", which covers any paths reported meanwhile
+                    pending = pending | set(dirty_paths) if pending and dirty_paths else set()
+                    check_files = check_files or pending_check
+                    paced = paced and pending_paced
+                else:
+                    pending = set(dirty_paths or ())
+                self.rescan_pending[root["path"]] = (pending, check_files, paced)
+                continue
+            # rescans run at idle I/O priority and, unless paced=False, budgeted so playback from the same disk doesn't stutter
+            worker = IndexerWorker(root["path"], self.library_index, rescan=True, dirty_paths=dirty_paths,
+                                   workers=root.get("workers", SCAN_WORKERS), io_budget=self.rescan_budget(root) if paced else None,
+                                   tag_mode=self.tag_mode, low_priority=True, check_files=check_files)
+            worker.log.connect(self.log_message)
+            worker.diff.connect(self.on_rescan_diff)
+            worker.moved.connect(self.on_tracks_moved)
+            worker.finished.connect(partial(self.on_rescan_finished, root["path"]))
+            self.rescan_workers[root["path"]] = worker
+            self.update_io_backoff()
+            worker.start(QtCore.QThread.LowestPriority)
+
+    def rescan_budget(self, root):
+        if root["path"] not in self.rescan_budgets:
+            budget = IOBudget(root.get("io_ops_per_sec", RESCAN_OPS_PER_SEC), root.get("io_bytes_per_sec", RESCAN_BYTES_PER_SEC))
+            self.rescan_budgets[root["path"]] = (budget, device_of(root["path"]))
+        return self.rescan_budgets[root["path"]][0]
+
+    def update_io_backoff(self):
+        """Back rescans off while audio is being read from the device they are scanning."""
+        if not self.rescan_budgets:
+            return
+        playing = None
+        if self.current_album_path and self.player.is_playing():
+            if self.playback_device[0] != self.current_album_path:
+                self.playback_device = (self.current_album_path, device_of(self.current_album_path))
+            playing = self.playback_device[1]
+        for budget, device in self.rescan_budgets.values():
+            budget.backoff = RESCAN_BACKOFF if playing is not None and device == playing else 1.0
+
+    def on_rescan_finished(self, root_path, _changed):
+        worker = self.rescan_workers.pop(root_path)
+        worker.wait()
+        self.watch_dirs[root_path] = worker.watch_dirs
+        worker.deleteLater()
+        if self.library_watcher is not None:
+            self.library_watcher.set_directories(self.watched_directories())
+        if root_path in self.rescan_pending:
+            dirty_paths, check_files, paced = self.rescan_pending.pop(root_path)
+            self.rescan_library(dirty_paths, [root_path], check_files, paced)
+
+    def on_tracks_moved(self, relocations):
+        relinked = relink_playlists(relocations)
+        self.log_message(f"{len(relocations)} tracks moved, {relinked} playlist entries relinked.")
+        if relinked and hasattr(self, "playlistShelf"):
+            self.playlistShelf.load_playlists()
+
+    def on_rescan_diff(self, diff):
+        self.albumTree.apply_album_diff({"removed": diff["removed"]})
+        changed = diff["added"] + diff["modified"]
+        if diff["removed"] or changed:
+            self.load_track_table()
+        # rows go in straight away; their covers load once they're on screen
+        self.albumTree.apply_album_diff({
+            "added": [tuple(album) + (None,) for album in diff["added"]],
+            "modified": [tuple(album) + (None,) for album in diff["modified"]],
+        })
+
     def open_search_dialog(self):
         dlg = SearchSongDialog(self)
         dlg.searchRequested.connect(self.start_song_search)
@@ -715,20 +2058,27 @@ class VinylPlayer(QtWidgets.QMainWindow):
         dlg.exec_()
 
     def start_song_search(self, query, dialog):
-        worker = SearchWorker("./Tracks", query)
-        worker.progress.connect(dialog.progressBar.setValue)
-        worker.result.connect(partial(dialog.add_result))
-        worker.finished.connect(dialog.on_search_finished)
+        if self.search_index is None and self.library_index is None:
+            dialog.on_search_finished()
+            return
+        # until the search index is built (right after a scan) the worker matches filenames in sqlite
+        worker = SearchWorker(self.search_index, self.library_index, query, dialog.refine_from(query, self.search_index))
         dialog.set_worker(worker)
         worker.start()
 
     def play_found_song(self, song_path):
-        album_path, filename = os.path.split(song_path)
-        if album_path != self.current_album_path:
+        album_path = self.library_index.track_album(song_path) if self.library_index else None
+        album_path = album_path or os.path.dirname(song_path)
+        if album_path != self.current_album_key:
             self.play_album(album_path)
-        if filename in self.current_tracks:
-            idx = self.current_tracks.index(filename)
-            self.media_list_player.play_item_at_index(idx)
+        self.play_track_path(song_path)
+
+    def play_track_path(self, song_path):
+        """Jump to song_path inside the current album, if it's in there."""
+        current_paths = [os.path.normpath(os.path.join(self.current_album_path or "", f)) for f in self.current_tracks]
+        song_path = os.path.normpath(song_path)
+        if song_path in current_paths:
+            self.media_list_player.play_item_at_index(current_paths.index(song_path))
     def seek_to(self, ms_timestamp: int):
         if hasattr(self, 'player') and self.player:
             self.player.set_time(ms_timestamp)
@@ -757,74 +2107,98 @@ class VinylPlayer(QtWidgets.QMainWindow):
             new_time = int((slider_value / 100) * total)
             print(f"[DEBUG] slider_released: Setting player time to {new_time} ms")
             self.player.set_time(new_time)
-    def extract_cover(self, song_path):
-        print(f"[DEBUG] extract_cover: Checking ID3 tags for: {song_path}")
-        try:
-            audio = ID3(song_path)
-            for tag in audio.values():
-                if isinstance(tag, APIC):
-                    cover_data = tag.data
-                    pixmap = QtGui.QPixmap()
-                    if pixmap.loadFromData(cover_data):
-                        print("[DEBUG] extract_cover: Found embedded cover art.")
-                        return pixmap
-        except Exception as e:
-            print("[DEBUG] extract_cover: Exception:", e)
-        print("[DEBUG] extract_cover: No cover found.")
-        return None
-    def update_background_from_cover(self):
-        if self.current_album_cover:
-            small = self.current_album_cover.scaled(1, 1, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
-            avg_color = QtGui.QColor(small.toImage().pixel(0, 0))
-            self.text_color = get_contrasting_color(avg_color)
+    def extract_cover(self, song_path, album_key=None):
+        """
+        Start decoding song_path's cover off the GUI thread; on_album_cover_decoded shows it.
+        With an album_key the window is themed right away if the index has its palette.
+        """
+        print(f"[DEBUG] extract_cover: Looking for cover art of: {song_path}")
+        if album_key and self.library_index:
+            palette = self.library_index.palette(album_key)
+            if palette:
+                self.update_background_from_cover(palette)
+        self.cover_request += 1
+        task = CoverDecodeTask(song_path, self.nowPlayingWidget.coverLabel.size(), self.cover_decoder, self.cover_request,
+                               self.library_index, album_key)
+        cover_pool().start(task, NOW_PLAYING_COVER_PRIORITY)
+    def on_album_cover_decoded(self, request_id, image, palette, backdrop):
+        if request_id != self.cover_request:
+            return  # another album was picked while this one decoded
+        had_backdrop = self.nowPlayingWidget.backdrop is not None
+        self.nowPlayingWidget.set_backdrop(backdrop)
+        if image is None:
+            print("[DEBUG] extract_cover: No cover found.")
+            self.current_album_cover = None
+            self.nowPlayingWidget.coverLabel.setPixmap(QtGui.QPixmap(resource_path("imag.png")))
+            if had_backdrop and self.current_palette:
+                self.update_background_from_cover(self.current_palette)  # text goes back over the plain colour
+            return
+        print("[DEBUG] extract_cover: Found cover art.")
+        content = cover_hash(image)
+        load = partial(QtGui.QPixmap.fromImage, image)
+        self.current_album_cover = pixmap_cache().get((content, image.width(), image.height()), load) if content else load()
+        self.nowPlayingWidget.coverLabel.setPixmap(self.current_album_cover)
+        if palette and (palette != self.current_palette or not had_backdrop):
+            self.update_background_from_cover(palette)
+    def update_background_from_cover(self, palette):
+        """Theme the window with a cover_palette: (primary, secondary, text) colour names."""
+        if palette:
+            self.current_palette = palette
+            avg_color, accent, text = (QtGui.QColor(c) for c in palette)
+            self.text_color = text
             album_bg = get_contrasting_color(avg_color).name()
             self.current_bg_color = avg_color
             self.current_text_color = self.text_color
 
-            palette = self.palette()
-            palette.setColor(QtGui.QPalette.Window, avg_color)
-            palette.setColor(QtGui.QPalette.WindowText, self.text_color)
-            self.setPalette(palette)
-
-            self.nowPlayingWidget.songLabel.setStyleSheet(f"color: {self.text_color.name()};")
-            self.nowPlayingWidget.timeLabel.setStyleSheet(f"color: {self.text_color.name()};")
-            self.nowPlayingWidget.coverLabel.setStyleSheet(f"color: {self.text_color.name()};")
-            self.nowPlayingWidget.albumLabel.setStyleSheet(f"color: {self.text_color.name()};")
-            self.nowPlayingWidget.artistLabel.setStyleSheet(f"color: {self.text_color.name()};")
-            self.trackList.setStyleSheet(f"background-color: {avg_color.name()}; color: {self.text_color.name()};")
+            window_palette = self.palette()
+            window_palette.setColor(QtGui.QPalette.Window, avg_color)
+            window_palette.setColor(QtGui.QPalette.WindowText, self.text_color)
+            window_palette.setColor(QtGui.QPalette.Highlight, accent)
+            window_palette.setColor(QtGui.QPalette.HighlightedText, get_contrasting_color(accent))
+            self.setPalette(window_palette)
+
+            # the backdrop is darkened for white text; without one the labels sit on the window colour
+            label_color = "#ffffff" if self.nowPlayingWidget.backdrop is not None else self.text_color.name()
+            self.nowPlayingWidget.songLabel.setStyleSheet(f"color: {label_color};")
+            self.nowPlayingWidget.timeLabel.setStyleSheet(f"color: {label_color};")
+            self.nowPlayingWidget.coverLabel.setStyleSheet(f"color: {label_color};")
+            self.nowPlayingWidget.albumLabel.setStyleSheet(f"color: {label_color};")
+            self.nowPlayingWidget.artistLabel.setStyleSheet(f"color: {label_color};")
+            selection = f"selection-background-color: {accent.name()}; selection-color: {get_contrasting_color(accent).name()};"
+            self.trackList.setStyleSheet(f"background-color: {avg_color.name()}; color: {self.text_color.name()}; {selection}")
             if hasattr(self, 'playlistShelf'):
                 self.playlistShelf.playlistList.setStyleSheet(f"background-color: {avg_color.name()}; color: {self.text_color.name()};")
                 self.playlistShelf.songList.setStyleSheet(f"background-color: {avg_color.name()}; color: {self.text_color.name()};")
             self.lyricsWidget.setStyleSheet(f"background-color: transparent; color: {self.text_color.name()};")
     def play_album(self, album_path, start_index=0):
         print(f"[DEBUG] play_album: Attempting to play album at {album_path}")
-        audio_files = [f for f in os.listdir(album_path) if f.lower().endswith(SUPPORTED_FORMATS)]
+        album_key = album_path
+        if is_tag_album(album_path):
+            # tag-driven albums can span folders: play them from a common parent with relative paths
+            track_paths = [row[0] for row in self.library_index.album_tracks(album_path)] if self.library_index else []
+            album_path = os.path.commonpath([os.path.dirname(p) for p in track_paths]) if track_paths else ""
+            audio_files = [os.path.relpath(p, album_path) for p in track_paths]
+            sorted_files = audio_files
+        else:
+            audio_files = [f for f in os.listdir(album_path) if f.lower().endswith(SUPPORTED_FORMATS)]
+            sorted_files = sorted(audio_files, key=natural_sort_key)
         if not audio_files:
             print("[DEBUG] play_album: No supported audio files found in that album.")
             QtWidgets.QMessageBox.warning(self, "No songs", "No supported audio files found in this album.")
             return
 
-        sorted_files = sorted(audio_files, key=natural_sort_key)
         self.current_album_path = album_path
+        self.current_album_key = album_key
 
         # set cover and labels from first track
         first_song = sorted_files[0]
         song_path = os.path.join(album_path, first_song)
         print(f"[DEBUG] play_album: first_song = {first_song}")
-        self.current_album_cover = self.extract_cover(song_path)
-        if self.current_album_cover:
-            scaled = self.current_album_cover.scaled(
-                self.nowPlayingWidget.coverLabel.size(),
-                QtCore.Qt.KeepAspectRatio,
-                QtCore.Qt.SmoothTransformation
-            )
-            self.nowPlayingWidget.coverLabel.setPixmap(scaled)
-        else:
-            self.nowPlayingWidget.coverLabel.setPixmap(QtGui.QPixmap(resource_path("imag.png")))
+        # the cover arrives in on_album_cover_decoded; the colours too unless the index has them
+        self.extract_cover(song_path, album_key)
         tag: TinyTag = TinyTag.get(song_path)
         self.nowPlayingWidget.albumLabel.setText(tag.album)
         self.nowPlayingWidget.artistLabel.setText(tag.artist)
-        self.update_background_from_cover()
 
         # Initialize media list and clear track list for grouped display
         self.media_list = vlc.MediaList()
@@ -1009,33 +2383,29 @@ class VinylPlayer(QtWidgets.QMainWindow):
             self.nowPlayingWidget.artistLabel.setText("")
         if hasattr(self, "lyricsWidget"):
             self.lyricsWidget.update_display(current_time)
+        self.update_io_backoff()
     def toggle_random_shuffle(self):
         print("[DEBUG] toggle_random_shuffle clicked.")
         if not self.random_shuffle_active:
-            song_list = []
-            for root, dirs, files in os.walk("./Tracks"):
-                for f in files:
-                    if f.lower().endswith(SUPPORTED_FORMATS):
-                        song_list.append((root, f))
-            if not song_list:
+            if self.track_table is not None:
+                row = self.track_table.random_row()
+                picked = (row.path, row.album_path) if row else None
+            else:
+                picked = self.library_index.random_track() if self.library_index else None
+            if not picked:
                 print("[DEBUG] No songs found for random shuffle.")
                 return
-            random.shuffle(song_list)
             self.random_shuffle_active = True
             self.album_shuffle_active = False
             self.randomShuffleButton.setIcon(QtGui.QIcon(resource_path("plit_green.png")))
             self.randomShuffleButton.setToolTip("Random Shuffle: ON")
             self.albumShuffleButton.setIcon(QtGui.QIcon(resource_path("shuf.png")))
             self.albumShuffleButton.setToolTip("Album Shuffle: OFF")
-            album_path, filename = song_list[0]
-            print(f"[DEBUG] toggle_random_shuffle: random album={album_path}, track={filename}")
+            song_path, album_path = picked
+            print(f"[DEBUG] toggle_random_shuffle: random album={album_path}, track={song_path}")
             self.play_album(album_path)
-            sorted_files = sorted([f for f in os.listdir(album_path) if f.lower().endswith(SUPPORTED_FORMATS)], key=natural_sort_key)
-            try:
-                index = sorted_files.index(filename)
-            except ValueError:
-                index = 0
-            self.media_list_player.play_item_at_index(index)
+            self.play_track_path(song_path)
+            self.random_shuffle_active = True
         else:
             self.random_shuffle_active = False
             self.randomShuffleButton.setIcon(QtGui.QIcon(resource_path("plit.png")))
@@ -1140,77 +2510,1259 @@ class VinylPlayer(QtWidgets.QMainWindow):
             item = QtWidgets.QListWidgetItem(f"{index+1}. {tag.title}")
             self.trackList.addItem(item)
         first_song = songs[0]
-        self.current_album_cover = self.extract_cover(first_song)
-        if self.current_album_cover:
-            scaled = self.current_album_cover.scaled(
-                self.nowPlayingWidget.coverLabel.size(),
-                QtCore.Qt.KeepAspectRatio,
-                QtCore.Qt.SmoothTransformation
-            )
-            self.nowPlayingWidget.coverLabel.setPixmap(scaled)
-        else:
-            self.nowPlayingWidget.coverLabel.setPixmap(QtGui.QPixmap(resource_path("imag.png")))
+        self.extract_cover(first_song)
         base, ext = os.path.splitext(first_song)
         lrc_file = base + ".lrc"
         self.lyricsWidget.load_lyrics(lrc_file)
         self.current_album_path = ""
         self.media_list_player.play_item_at_index(0)
-class IndexerWorker(QtCore.QThread):
-    log = QtCore.pyqtSignal(str)
-    finished = QtCore.pyqtSignal(list)
+class LibraryIndex:
+    """
+    Persistent sqlite index of the library (artists, albums, tracks, tags, durations
+    and cover references), so later launches only re-read what changed on disk.
+    Safe to share between the indexer thread, cover tasks and the GUI thread.
+    """
+    def __init__(self, db_path=INDEX_FILE):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS artists (
+                artist_path TEXT PRIMARY KEY,
+                artist TEXT NOT NULL,
+                mtime REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS albums (
+                album_path TEXT PRIMARY KEY,
+                artist TEXT NOT NULL,
+                album TEXT NOT NULL,
+                first_audio TEXT NOT NULL,
+                mtime REAL NOT NULL DEFAULT 0,
+                cover_ref TEXT NOT NULL DEFAULT '',
+                palette TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS tracks (
+                path TEXT PRIMARY KEY,
+                album_path TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                title TEXT NOT NULL DEFAULT '',
+                artist TEXT NOT NULL DEFAULT '',
+                album TEXT NOT NULL DEFAULT '',
+                albumartist TEXT NOT NULL DEFAULT '',
+                track_no INTEGER NOT NULL DEFAULT 0,
+                disc_no INTEGER NOT NULL DEFAULT 0,
+                duration REAL NOT NULL DEFAULT 0,
+                fingerprint TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS tracks_album ON tracks(album_path);
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT NOT NULL,
+                mtime REAL NOT NULL
+            );
+        """)
+        if "fingerprint" not in {r[1] for r in self.conn.execute("PRAGMA table_info(tracks)")}:
+            # index from before fingerprints; those tracks get re-read (and fingerprinted) once
+            self.conn.execute("ALTER TABLE tracks ADD COLUMN fingerprint TEXT NOT NULL DEFAULT ''")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tracks_fingerprint ON tracks(fingerprint)")
+        if "palette" not in {r[1] for r in self.conn.execute("PRAGMA table_info(albums)")}:
+            # palettes get filled in as covers are extracted
+            self.conn.execute("ALTER TABLE albums ADD COLUMN palette TEXT NOT NULL DEFAULT ''")
+        self.conn.commit()
 
-    def __init__(self, tracks_folder):
-        super().__init__()
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def reader(self):
+        """A read-only connection for long reads; WAL lets it run next to writes without self.lock."""
+        return sqlite3.connect(pathlib.Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro", uri=True)
+
+    def track_stats(self, album_path):
+        """{filename: (size, mtime)} of the fingerprinted tracks indexed for one album."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT filename, size, mtime FROM tracks WHERE album_path = ? AND fingerprint != ''", (album_path,)
+            ).fetchall()
+        return {filename: (size, mtime) for filename, size, mtime in rows}
+
+    def update_album(self, artist, artist_path, album, album_path, first_audio, mtime, changed_tracks, present_files):
+        """
+        Store one album. changed_tracks is a list of (filename, size, mtime, tags) for files
+        whose stat differs from the index; tracks not in present_files are dropped.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO artists (artist_path, artist) VALUES (?, ?)", (artist_path, artist)
+            )
+            row = self.conn.execute(
+                "SELECT first_audio, cover_ref, palette FROM albums WHERE album_path = ?", (album_path,)
+            ).fetchone()
+            cover_ref, palette = row[1:] if row and row[0] == first_audio and not changed_tracks else ("", "")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO albums (album_path, artist, album, first_audio, mtime, cover_ref, palette) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (album_path, artist, album, first_audio, mtime, cover_ref, palette)
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tracks (path, album_path, filename, size, mtime, title, artist, album, "
+                "albumartist, track_no, disc_no, duration, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (os.path.join(album_path, filename), album_path, filename, size, file_mtime,
+                     tags["title"], tags["artist"], tags["album"], tags["albumartist"],
+                     tags["track_no"], tags["disc_no"], tags["duration"], tags.get("fingerprint", ""))
+                    for filename, size, file_mtime, tags in changed_tracks
+                ]
+            )
+            indexed = {r[0] for r in self.conn.execute(
+                "SELECT filename FROM tracks WHERE album_path = ?", (album_path,)
+            )}
+            gone = indexed - set(present_files)
+            self.conn.executemany(
+                "DELETE FROM tracks WHERE path = ?", [(os.path.join(album_path, f),) for f in gone]
+            )
+
+    def prune(self, root, seen_album_paths):
+        """Drop albums under root that were not seen in the last scan. Returns how many went."""
+        prefix = os.path.join(root, "")
+        with self.lock, self.conn:
+            stale = [
+                r[0] for r in self.conn.execute("SELECT album_path FROM albums")
+                if album_location(r[0]).startswith(prefix) and r[0] not in seen_album_paths
+            ]
+            self.conn.executemany("DELETE FROM tracks WHERE album_path = ?", [(p,) for p in stale])
+            self.conn.executemany("DELETE FROM albums WHERE album_path = ?", [(p,) for p in stale])
+            live_artists = {os.path.dirname(r[0]) for r in self.conn.execute("SELECT album_path FROM albums")}
+            self.conn.executemany(
+                "DELETE FROM artists WHERE artist_path = ?",
+                [r for r in self.conn.execute("SELECT artist_path FROM artists").fetchall()
+                 if r[0].startswith(prefix) and r[0] not in live_artists]
+            )
+        return len(stale)
+
+    def dirs(self, root):
+        """{path: (parent, mtime)} for root and every directory recorded below it."""
+        prefix = os.path.join(root, "")
+        with self.lock:
+            rows = self.conn.execute("SELECT path, parent, mtime FROM dirs").fetchall()
+        return {path: (parent, mtime) for path, parent, mtime in rows if path == root or path.startswith(prefix)}
+
+    def set_dirs(self, root, seen_dirs):
+        """Replace the recorded directory mtimes under root with seen_dirs {path: (parent, mtime)}."""
+        stale = set(self.dirs(root)) - set(seen_dirs)
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM dirs WHERE path = ?", [(p,) for p in stale])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO dirs (path, parent, mtime) VALUES (?, ?, ?)",
+                [(path, parent, mtime) for path, (parent, mtime) in seen_dirs.items()]
+            )
+
+    def albums(self, root=None):
+        """4-tuples (artist, album, album_path, first_audio), same shape IndexerWorker emits."""
+        with self.lock:
+            rows = self.conn.execute("SELECT artist, album, album_path, first_audio FROM albums").fetchall()
+        if root is not None:
+            prefix = os.path.join(root, "")
+            rows = [r for r in rows if album_location(r[2]).startswith(prefix)]
+        return sorted(rows, key=lambda r: (natural_sort_key(r[0]), natural_sort_key(r[1])))
+
+    def album_tracks(self, album_path):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, filename, title, artist, album, albumartist, track_no, disc_no, duration "
+                "FROM tracks WHERE album_path = ?", (album_path,)
+            ).fetchall()
+        if is_tag_album(album_path):
+            return sorted(rows, key=lambda r: (r[7], r[6], natural_sort_key(r[1])))
+        return sorted(rows, key=lambda r: natural_sort_key(r[1]))
+
+    def track_rows(self, root):
+        """{path: (size, mtime, album_path, tags)} for every track under root; tags include the fingerprint."""
+        prefix = os.path.join(root, "")
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime, album_path, title, artist, album, albumartist, track_no, disc_no, duration, "
+                "fingerprint FROM tracks"
+            ).fetchall()
+        return {
+            r[0]: (r[1], r[2], r[3], dict(zip(TRACK_TAG_FIELDS + ("fingerprint",), r[4:])))
+            for r in rows if r[0].startswith(prefix)
+        }
+
+    def store_tag_albums(self, albums, tracks):
+        """
+        Store tag-driven albums. albums is [(artist, album, album_key, first_audio)];
+        tracks is [(path, album_key, size, mtime, tags)] for tracks that are new, changed
+        or moved to another album. Call prune() afterwards to drop what disappeared.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO albums (album_path, artist, album, first_audio) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(album_path) DO UPDATE SET artist = excluded.artist, album = excluded.album, "
+                "cover_ref = CASE WHEN first_audio = excluded.first_audio THEN cover_ref ELSE '' END, "
+                "palette = CASE WHEN first_audio = excluded.first_audio THEN palette ELSE '' END, "
+                "first_audio = excluded.first_audio",
+                [(key, artist, album, first_audio) for artist, album, key, first_audio in albums]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tracks (path, album_path, filename, size, mtime, title, artist, album, "
+                "albumartist, track_no, disc_no, duration, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (path, key, os.path.basename(path), size, mtime,
+                     tags["title"], tags["artist"], tags["album"], tags["albumartist"],
+                     tags["track_no"], tags["disc_no"], tags["duration"], tags.get("fingerprint", ""))
+                    for path, key, size, mtime, tags in tracks
+                ]
+            )
+
+    def search_filenames(self, query):
+        """Case-insensitive filename match over every indexed track (Ctrl+F's fallback, see SearchWorker)."""
+        query = query.lower()
+        with self.lock:
+            rows = self.conn.execute("SELECT path, filename FROM tracks").fetchall()
+        return sorted((path for path, filename in rows if query in filename.lower()), key=natural_sort_key)
+
+    def random_track(self):
+        """(path, album_path) of a random indexed track, or None if the index is empty."""
+        with self.lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            if not total:
+                return None
+            return self.conn.execute(
+                "SELECT path, album_path FROM tracks LIMIT 1 OFFSET ?", (random.randrange(total),)
+            ).fetchone()
+
+    def fingerprints(self):
+        """
+        {fingerprint: (path, tags, cover_ref)} over every fingerprinted track; cover_ref is
+        its album's, and only set when the track is the one the album's cover comes from.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT t.fingerprint, t.path, t.title, t.artist, t.album, t.albumartist, t.track_no, t.disc_no, "
+                "t.duration, t.album_path, a.first_audio, a.cover_ref "
+                "FROM tracks t LEFT JOIN albums a ON a.album_path = t.album_path WHERE t.fingerprint != ''"
+            ).fetchall()
+        return {
+            r[0]: (r[1], dict(zip(TRACK_TAG_FIELDS, r[2:9]), fingerprint=r[0]),
+                   r[11] if r[10] is not None and os.path.join(r[9], r[10]) == r[1] else "")
+            for r in rows
+        }
+
+    def track_album(self, path):
+        with self.lock:
+            row = self.conn.execute("SELECT album_path FROM tracks WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def drop_tracks(self, paths):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM tracks WHERE path = ?", [(p,) for p in paths])
+
+    def cover_refs(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT album_path, cover_ref FROM albums"))
+
+    def cover_ref(self, album_path):
+        with self.lock:
+            row = self.conn.execute("SELECT cover_ref FROM albums WHERE album_path = ?", (album_path,)).fetchone()
+        return row[0] if row and row[0] else ""
+
+    def set_cover_refs(self, refs):
+        """Palettes of albums whose cover_ref changes are dropped with it."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE albums SET palette = CASE WHEN cover_ref = ? THEN palette ELSE '' END, cover_ref = ? "
+                "WHERE album_path = ?",
+                [(ref, ref, album_path) for album_path, ref in refs])
+
+    def palettes(self):
+        """{album_path: (primary, secondary, text)} of the albums a cover_palette was stored for."""
+        with self.lock:
+            rows = self.conn.execute("SELECT album_path, palette FROM albums WHERE palette != ''").fetchall()
+        return {album_path: tuple(palette.split(",")) for album_path, palette in rows}
+
+    def palette(self, album_path):
+        with self.lock:
+            row = self.conn.execute("SELECT palette FROM albums WHERE album_path = ?", (album_path,)).fetchone()
+        return tuple(row[0].split(",")) if row and row[0] else None
+
+    def set_palettes(self, palettes):
+        """palettes is [(album_path, (primary, secondary, text))]."""
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE albums SET palette = ? WHERE album_path = ?",
+                                  [(",".join(palette), album_path) for album_path, palette in palettes])
+
+    def counts(self):
+        with self.lock:
+            return {
+                table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("artists", "albums", "tracks")
+            }
+class StringPool:
+    """Interns repeated strings (artists, albums, folders, album keys) as small integer ids."""
+    __slots__ = ("strings", "ids")
+
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def intern(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def __getitem__(self, i):
+        return self.strings[i]
+
+    def __len__(self):
+        return len(self.strings)
+
+class PackedStrings:
+    """Mostly-unique strings (filenames, titles) kept as one utf-8 blob plus an offsets array."""
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = array("I", [0])
+
+    def append(self, s):
+        self.blob += s.encode("utf-8", "surrogateescape")
+        self.offsets.append(len(self.blob))
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode("utf-8", "surrogateescape")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+class TrackRow:
+    """Read-only view of one row of a TrackTable; costs two slots, not a dict per track."""
+    __slots__ = ("table", "i")
+
+    def __init__(self, table, i):
+        self.table = table
+        self.i = i
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, self.filename)
+
+    @property
+    def folder(self):
+        return self.table.strings[self.table.folder[self.i]]
+
+    @property
+    def filename(self):
+        return self.table.filename[self.i]
+
+    @property
+    def album_path(self):
+        return self.table.strings[self.table.album_path[self.i]]
+
+    @property
+    def title(self):
+        return self.table.title[self.i]
+
+    @property
+    def artist(self):
+        return self.table.strings[self.table.artist[self.i]]
+
+    @property
+    def album(self):
+        return self.table.strings[self.table.album[self.i]]
+
+    @property
+    def albumartist(self):
+        return self.table.strings[self.table.albumartist[self.i]]
+
+    @property
+    def track_no(self):
+        return self.table.track_no[self.i]
+
+    @property
+    def disc_no(self):
+        return self.table.disc_no[self.i]
+
+    @property
+    def duration(self):
+        return self.table.duration[self.i]
+
+    def __repr__(self):
+        return f"TrackRow({self.i}, {self.path!r})"
+
+class TrackTable:
+    """
+    Columnar in-memory copy of the tracks table. Repeated strings are interned into one
+    StringPool and stored as integer ids, numbers live in typed arrays, so a million
+    tracks fit in tens of MB.
+    """
+    ID_COLUMNS = ("folder", "album_path", "artist", "album", "albumartist")
+
+    def __init__(self):
+        self.strings = StringPool()
+        for name in self.ID_COLUMNS:
+            setattr(self, name, array("I"))
+        self.filename = PackedStrings()
+        self.title = PackedStrings()
+        self.track_no = array("H")
+        self.disc_no = array("H")
+        self.duration = array("f")
+
+    @classmethod
+    def from_index(cls, index):
+        table = cls()
+        # its own connection: holding index.lock this long would stall the GUI thread's index calls
+        conn = index.reader()
+        try:
+            cursor = conn.execute(
+                "SELECT path, album_path, title, artist, album, albumartist, track_no, disc_no, duration FROM tracks"
+            )
+            for row in cursor:
+                table.append(*row)
+        finally:
+            conn.close()
+        return table
+
+    def append(self, path, album_path, title, artist, album, albumartist, track_no, disc_no, duration):
+        intern = self.strings.intern
+        folder, filename = os.path.split(path)
+        self.folder.append(intern(folder))
+        self.album_path.append(intern(album_path))
+        self.artist.append(intern(artist))
+        self.album.append(intern(album))
+        self.albumartist.append(intern(albumartist))
+        self.filename.append(filename)
+        self.title.append(title)
+        self.track_no.append(min(max(int(track_no or 0), 0), 0xFFFF))
+        self.disc_no.append(min(max(int(disc_no or 0), 0), 0xFFFF))
+        self.duration.append(float(duration or 0))
+
+    def __len__(self):
+        return len(self.track_no)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        return TrackRow(self, i % len(self))
+
+    def __iter__(self):
+        return (TrackRow(self, i) for i in range(len(self)))
+
+    def nbytes(self):
+        total = len(self.filename.blob) + len(self.title.blob)
+        for col in (self.filename.offsets, self.title.offsets, self.track_no, self.disc_no, self.duration,
+                    *(getattr(self, name) for name in self.ID_COLUMNS)):
+            total += len(col) * col.itemsize
+        return total + sum(sys.getsizeof(s) for s in self.strings.strings)
+
+    def random_row(self):
+        """A random TrackRow, or None when the table is empty."""
+        return TrackRow(self, random.randrange(len(self))) if len(self) else None
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrackSearchIndex:
+    """
+    Trigram index over the title, artist, album and filename of every row of a TrackTable.
+    Documents are numbered in natural path order so posting lists (and therefore results)
+    come out already sorted. Candidates from the rarest trigrams are confirmed against one
+    casefolded text blob; a query never touches sqlite or the filesystem.
+    """
+    VERIFY_LIMIT = 256  # stop intersecting posting lists once this few candidates are left
+    CANCEL_CHECK = 4096  # documents between looks at the cancelled() callback
+
+    def __init__(self, table):
+        self.table = table
+        self.rows = array("I", sorted(range(len(table)), key=lambda i: natural_sort_key(table[i].path)))
+        postings = defaultdict(partial(array, "I"))
+        self.starts = array("I", [0])
+        pooled = {}  # artist/album string id -> its trigrams, they repeat across an album's tracks
+        parts = []
+        length = 0
+        for doc, row in enumerate(self.rows):
+            fields = [table.title[row].casefold(), table.filename[row].casefold()]
+            grams = trigrams(fields[0]) | trigrams(fields[1])
+            for string_id in (table.artist[row], table.album[row]):
+                text = table.strings[string_id].casefold()
+                fields.append(text)
+                if string_id not in pooled:
+                    pooled[string_id] = trigrams(text)
+                grams |= pooled[string_id]
+            text = "\t".join(fields)
+            parts.append(text)
+            length += len(text) + 1
+            self.starts.append(length)
+            for gram in grams:
+                postings[gram].append(doc)
+        self.postings = dict(postings)
+        self.text = "\n".join(parts) + "\n"
+
+    def __len__(self):
+        return len(self.rows)
+
+    def document(self, doc):
+        return self.text[self.starts[doc]:self.starts[doc + 1] - 1]
+
+    def candidates(self, grams):
+        """Documents containing every trigram in grams (or a small superset of them)."""
+        postings = [self.postings.get(gram) for gram in grams]
+        if any(posting is None for posting in postings):
+            return []
+        postings.sort(key=len)
+        docs = postings[0]
+        for posting in postings[1:]:
+            if len(docs) <= self.VERIFY_LIMIT:
+                break
+            if numpy is not None:
+                docs = numpy.intersect1d(docs, numpy.frombuffer(posting, dtype="I"), assume_unique=True)
+            else:
+                keep = set(posting)
+                docs = array("I", (doc for doc in docs if doc in keep))
+        return docs.tolist()
+
+    def scan(self, term, cancelled=None):
+        """Documents containing term, found with str.find over the blob (for terms too short for trigrams)."""
+        docs = []
+        pos = self.text.find(term)
+        while pos != -1:
+            if cancelled is not None and not len(docs) % self.CANCEL_CHECK and cancelled():
+                return None
+            doc = bisect.bisect_right(self.starts, pos) - 1
+            docs.append(doc)
+            pos = self.text.find(term, self.starts[doc + 1])
+        return docs
+
+    def path(self, doc):
+        row = self.rows[doc]
+        return os.path.join(self.table.strings.strings[self.table.folder[row]], self.table.filename[row])
+
+    @staticmethod
+    def terms(query):
+        return sorted(set(query.casefold().split()), key=len, reverse=True)
+
+    @classmethod
+    def narrows(cls, query, previous):
+        """True when every match of query is also a match of previous, so previous's results can be refined."""
+        old, new = cls.terms(previous), cls.terms(query)
+        return bool(old) and all(any(term in word for word in new) for term in old)
+
+    def search_docs(self, query, within=None, cancelled=None):
+        """
+        Sorted document numbers matching query; only those out of within (the result of a
+        broader query, see narrows) when it's given. None if cancelled() turned true meanwhile.
+        """
+        terms = self.terms(query)
+        if not terms:
+            return []
+        if within is not None:
+            docs = within
+        else:
+            grams = set().union(*(trigrams(term) for term in terms))
+            docs = self.candidates(grams) if grams else self.scan(terms[0], cancelled)
+            if docs is None:
+                return None
+        matches = []
+        for i, doc in enumerate(docs):
+            if cancelled is not None and not i % self.CANCEL_CHECK and cancelled():
+                return None
+            text = self.document(doc)
+            if all(term in text for term in terms):
+                matches.append(doc)
+        return matches
+
+    def search(self, query, root=None):
+        """
+        Paths of the tracks whose title/artist/album/filename contain every word of query
+        (case-insensitive), in natural path order; only those under root if it's given.
+        """
+        paths = [self.path(doc) for doc in self.search_docs(query)]
+        if root is not None:
+            prefix = os.path.join(root, "")
+            paths = [path for path in paths if path.startswith(prefix)]
+        return paths
+
+class IOBudget:
+    """
+    Paces filesystem work: spend() blocks so that no more than ops_per_sec
+    directory listings/stats/opens and bytes_per_sec bytes read happen per second
+    across every scanner thread (either limit may be None).
+    backoff divides both rates; the GUI raises it while playback uses the same device.
+    """
+    def __init__(self, ops_per_sec=None, bytes_per_sec=None):
+        self.ops_per_sec = float(ops_per_sec) if ops_per_sec else None
+        self.bytes_per_sec = float(bytes_per_sec) if bytes_per_sec else None
+        self.backoff = 1.0
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def spend(self, ops=1, nbytes=0):
+        cost = 0.0
+        if self.ops_per_sec:
+            cost = ops / self.ops_per_sec
+        if self.bytes_per_sec and nbytes:
+            cost = max(cost, nbytes / self.bytes_per_sec)
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_free)
+            self.next_free = start + cost * self.backoff
+            wait = start - now
+        if wait > 0:
+            time.sleep(wait)
+class LibraryScanner:
+    """
+    Scans Tracks/Artist/Album with os.scandir, one artist per task on a thread pool.
+    Results come back in natural_sort_key order no matter which thread finished first.
+    Has no Qt dependency; IndexerWorker wraps it for the GUI.
+    """
+    def __init__(self, tracks_folder, index=None, workers=SCAN_WORKERS, io_budget=None, log=print, on_albums=None, low_priority=False):
         self.tracks_folder = tracks_folder
+        self.index = index
+        self.workers = max(1, int(workers))
+        self.io_budget = io_budget
+        # run every scanning thread/process in the OS's background I/O class (see lower_io_priority)
+        self.low_priority = low_priority
+        self.log = log
+        # called with lists of 4-tuples as the scan goes (see ALBUM_BATCH_SIZE / ALBUM_BATCH_SECONDS)
+        self.on_albums = on_albums
+        self.pending_albums = []
+        self.last_flush = time.monotonic()
+        # {old path: new path} of tracks found again under another path (same file_fingerprint)
+        self.relocations = {}
+        self.moved_cover_refs = {}  # new path -> cover_ref its old album had, for covers that moved with it
+        self.cover_files = {}  # listed directory -> path of the sidecar cover (cover_file_name) in it, or None
+        self.known_fingerprints = None  # LibraryIndex.fingerprints(), loaded on first use
+        # what the index recorded for the directories a tag rescan may skip listing (see list_dir)
+        self.known_dirs = {}
+        self.known_children = {}
+        self.known_files = {}  # folder -> {path: (size, mtime)}
+        self.dirty_paths = set()  # directories to list no matter their mtime
+        self.visit = None  # see target
+        self.fingerprint_lock = threading.Lock()
 
-    def run(self):
-        albums = []
-        if not os.path.exists(self.tracks_folder):
-            self.log.emit("Tracks directory not found.")
-            self.finished.emit(albums)
+    def deliver(self, albums, force=False):
+        if self.on_albums is None:
             return
+        self.pending_albums.extend(albums)
+        due = time.monotonic() - self.last_flush >= ALBUM_BATCH_SECONDS
+        while self.pending_albums and (force or due or len(self.pending_albums) >= ALBUM_BATCH_SIZE):
+            batch = self.pending_albums[:ALBUM_BATCH_SIZE]
+            del self.pending_albums[:ALBUM_BATCH_SIZE]
+            self.on_albums(batch)
+            self.last_flush = time.monotonic()
+            due = False
 
-        try:
-            artists = sorted(os.listdir(self.tracks_folder), key=natural_sort_key)
-        except Exception as e:
-            self.log.emit(f"Error listing tracks folder: {e}")
-            self.finished.emit(albums)
+    def spend(self, ops=1, nbytes=0):
+        if self.io_budget is not None:
+            self.io_budget.spend(ops, nbytes)
+
+    def thread_pool(self):
+        return concurrent.futures.ThreadPoolExecutor(
+            self.workers, initializer=lower_io_priority if self.low_priority else None)
+
+    def list_subdirs(self, path):
+        """[(name, path, mtime)] of the sub-directories of path, sorted with natural_sort_key."""
+        self.spend()
+        subdirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        subdirs.append((entry.name, entry.path, entry.stat().st_mtime))
+                except OSError:
+                    continue
+        subdirs.sort(key=lambda d: natural_sort_key(d[0]))
+        return subdirs
+
+    def list_audio(self, path):
+        """{filename: (size, mtime)} of the supported audio files directly in path."""
+        self.spend()
+        audio = {}
+        others = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if not entry.name.lower().endswith(SUPPORTED_FORMATS):
+                    others.append(entry.name)
+                    continue
+                try:
+                    if entry.is_file():
+                        st = entry.stat()
+                        audio[entry.name] = (st.st_size, st.st_mtime)
+                except OSError:
+                    continue
+        self.note_cover_file(path, others)
+        return audio
+
+    def note_cover_file(self, path, names):
+        """Remember the sidecar cover among the file names listed in path."""
+        name = cover_file_name(names)
+        self.cover_files[path] = os.path.join(path, name) if name else None
+
+    def identify(self, path, size, mtime):
+        """
+        (fingerprint, tags) for a file the index doesn't know under this path/stat. If another
+        indexed track has the same fingerprint its tags are reused (tags is None otherwise), and
+        when that track's file is gone the move is recorded in self.relocations.
+        """
+        self.spend(1, min(size, 2 * FINGERPRINT_BYTES))
+        fingerprint = file_fingerprint(path, size, mtime)
+        with self.fingerprint_lock:
+            if self.known_fingerprints is None:
+                self.known_fingerprints = self.index.fingerprints() if self.index else {}
+            known = self.known_fingerprints.get(fingerprint) if fingerprint else None
+        if known is None:
+            return fingerprint, None
+        old_path, tags, cover_ref = known
+        if old_path != path and not os.path.exists(old_path):
+            with self.fingerprint_lock:
+                self.relocations[old_path] = path
+                if cover_ref == f"embedded:{old_path}":
+                    self.moved_cover_refs[path] = f"embedded:{path}"
+                elif cover_ref == "none":
+                    self.moved_cover_refs[path] = cover_ref
+        return fingerprint, dict(tags)
+
+    def read_changed(self, album_path, audio):
+        """Tags for the files whose size/mtime differ from the index, as update_album expects them."""
+        known = self.index.track_stats(album_path) if self.index else {}
+        changed = []
+        for f, (size, mtime) in audio.items():
+            if known.get(f) == (size, mtime):
+                continue
+            path = os.path.join(album_path, f)
+            fingerprint, tags = self.identify(path, size, mtime)
+            if tags is None:
+                self.spend(1, min(size, TAG_READ_BYTES))
+                tags = dict(read_track_tags(path), fingerprint=fingerprint)
+            changed.append((f, size, mtime, tags))
+        return changed
+
+    def record_covers(self, albums):
+        """
+        Set the cover_ref of albums whose folder was listed: its sidecar cover if it has one,
+        else the reference the old album had if the first track only moved. A sidecar recorded
+        earlier that is gone now clears the reference, so the cover is probed again.
+        """
+        if not self.index:
             return
+        current = self.index.cover_refs()
+        refs = []
+        for _artist, _album, album_path, first_audio in albums:
+            first_audio_path = os.path.join(album_path, first_audio)
+            folder = os.path.dirname(first_audio_path)
+            if folder not in self.cover_files:
+                continue
+            ref = current.get(album_path, "")
+            if self.cover_files[folder]:
+                ref = f"file:{self.cover_files[folder]}"
+            elif first_audio_path in self.moved_cover_refs:
+                ref = self.moved_cover_refs[first_audio_path]
+            elif ref.startswith("file:"):
+                ref = ""
+            if ref != current.get(album_path, ""):
+                refs.append((album_path, ref))
+        if refs:
+            self.index.set_cover_refs(refs)
 
-        total_artists = len(artists)
-        self.log.emit("Starting indexing...")
-        for i, artist in enumerate(artists):
-            artist_path = os.path.join(self.tracks_folder, artist)
-            if not os.path.isdir(artist_path):
+    def scan_album(self, album_path):
+        audio = self.list_audio(album_path)
+        if not audio:
+            return None
+        first_audio = min(audio, key=natural_sort_key)
+        return first_audio, audio, self.read_changed(album_path, audio)
+
+    def scan_artist(self, artist_path):
+        """(album_dirs, albums, errors) for one artist; runs on a pool thread."""
+        errors = []
+        albums = []
+        try:
+            album_dirs = self.list_subdirs(artist_path)
+        except OSError as e:
+            return None, [], [f"error listing albums: {e}"]
+        for album, album_path, album_mtime in album_dirs:
+            try:
+                scanned = self.scan_album(album_path)
+            except OSError as e:
+                errors.append(f"{album}: error listing files: {e}")
                 continue
+            if scanned:
+                albums.append((album, album_path, album_mtime) + scanned)
+        return album_dirs, albums, errors
 
+    def scan(self):
+        """Full scan. Returns 4-tuples (artist, album, album_path, first_audio)."""
+        albums = []
+        seen_dirs = {}
+        root = self.tracks_folder
+        try:
+            seen_dirs[root] = ("", os.stat(root).st_mtime)
+            artists = self.list_subdirs(root)
+        except OSError as e:
+            self.log("Tracks directory not found." if not os.path.exists(root) else f"Error listing tracks folder: {e}")
+            return albums
+
+        total_artists = len(artists)
+        reread = 0
+        started = time.perf_counter()
+        if self.index and self.index.counts()["tracks"]:
+            # snapshot before any update_album below drops the old rows of tracks that moved
+            self.known_fingerprints = self.index.fingerprints()
+        self.log(f"Starting indexing with {self.workers} threads...")
+        with self.thread_pool() as pool:
+            results = pool.map(self.scan_artist, [artist_path for _artist, artist_path, _mtime in artists])
+            for i, ((artist, artist_path, artist_mtime), (album_dirs, artist_albums, errors)) in enumerate(zip(artists, results)):
+                for error in errors:
+                    self.log(f"{artist}: {error}")
+                if album_dirs is None:
+                    continue
+                seen_dirs[artist_path] = (root, artist_mtime)
+                for _album, album_path, album_mtime in album_dirs:
+                    seen_dirs[album_path] = (artist_path, album_mtime)
+                found = []
+                for album, album_path, album_mtime, first_audio, audio, changed in artist_albums:
+                    found.append((artist, album, album_path, first_audio))
+                    if self.index:
+                        self.index.update_album(artist, artist_path, album, album_path, first_audio, album_mtime, changed, audio)
+                    reread += len(changed)
+                albums.extend(found)
+                self.deliver(found)
+                if artist_albums:
+                    self.log(f"{artist}: indexed albums -> " + ", ".join(a[0] for a in artist_albums))
+                else:
+                    self.log(f"{artist}: no valid albums found.")
+                self.log(f"Finished artist {artist} ({i+1}/{total_artists})")
+        self.deliver([], force=True)
+        if self.index:
+            self.record_covers(albums)
+            pruned = self.index.prune(root, {a[2] for a in albums})
+            self.index.set_dirs(root, seen_dirs)
+            self.log(f"Index updated: {reread} tracks re-read, {len(self.relocations)} moved, {pruned} albums removed.")
+        self.log(f"Indexed {len(albums)} albums in {time.perf_counter() - started:.2f}s.")
+        return albums
+
+    def target(self, root, dirty_paths):
+        """
+        Limit a rescan to dirty_paths and the directories above them (up to root); every other
+        directory is taken as unchanged without a stat. No dirty_paths means check everything.
+        """
+        self.dirty_paths = set(dirty_paths)
+        self.visit = None
+        if self.dirty_paths:
+            self.visit = {root}
+            prefix = os.path.join(root, "")
+            for path in self.dirty_paths:
+                while path.startswith(prefix) and path not in self.visit:
+                    self.visit.add(path)
+                    path = os.path.dirname(path)
+
+    def skips(self, path):
+        return self.visit is not None and path not in self.visit
+
+    def list_dir(self, path, mtime):
+        """
+        ({file path: (size, mtime)} of the supported audio, [(dir path, mtime)]) directly in path.
+        A directory recorded in known_dirs with this same mtime isn't listed again; its files and
+        sub-directories come from the index instead.
+        """
+        known = self.known_dirs.get(path)
+        if known is not None and known[1] == mtime and path not in self.dirty_paths:
+            subdirs = []
+            for child in self.known_children.get(path, ()):
+                if self.skips(child):
+                    child_mtime = self.known_dirs[child][1]
+                else:
+                    self.spend()
+                    child_mtime = dir_mtime(child)
+                if child_mtime is not None:
+                    subdirs.append((child, child_mtime))
+            return dict(self.known_files.get(path, {})), subdirs
+        self.spend()
+        files, subdirs, others = {}, [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        subdirs.append((entry.path, entry.stat().st_mtime))
+                    elif entry.name.lower().endswith(SUPPORTED_FORMATS):
+                        if entry.is_file():
+                            st = entry.stat()
+                            files[entry.path] = (st.st_size, st.st_mtime)
+                    else:
+                        others.append(entry.name)
+                except OSError:
+                    continue
+        self.note_cover_file(path, others)
+        return files, subdirs
+
+    def walk_audio(self, path, parent, mtime):
+        """
+        ({path: (size, mtime)} of every supported audio file below path at any depth,
+        {directory: (parent, mtime)} of the directories walked).
+        """
+        files, dirs = {}, {}
+        stack = [(path, parent, mtime)]
+        while stack:
+            current, parent, mtime = stack.pop()
             try:
-                albums_in_artist = sorted(os.listdir(artist_path), key=natural_sort_key)
-            except Exception as e:
-                self.log.emit(f"{artist}: error listing albums: {e}")
+                found, subdirs = self.list_dir(current, mtime)
+            except OSError as e:
+                self.log(f"{current}: error listing: {e}")
                 continue
+            dirs[current] = (parent, mtime)
+            files.update(found)
+            stack.extend((subdir, current, subdir_mtime) for subdir, subdir_mtime in subdirs)
+        return files, dirs
+
+    def read_tags_parallel(self, paths):
+        """{path: tags} for paths, read in TAG_CHUNK_SIZE chunks on a process pool."""
+        tags = {}
+        total = len(paths)
+        if not total:
+            return tags
+        started = time.perf_counter()
+        chunks = [paths[i:i + TAG_CHUNK_SIZE] for i in range(0, total, TAG_CHUNK_SIZE)]
+        if len(chunks) == 1:
+            results = map(read_tags_chunk, chunks)
+            pool = None
+        else:
+            # spawn, not fork: this runs on a QThread of a process that already has Qt and VLC threads
+            pool = concurrent.futures.ProcessPoolExecutor(
+                min(TAG_WORKERS, len(chunks)), mp_context=multiprocessing.get_context("spawn"),
+                initializer=lower_io_priority if self.low_priority else None)
+            results = pool.map(read_tags_chunk, chunks)
+        try:
+            for chunk, chunk_tags in zip(chunks, results):
+                self.spend(len(chunk), len(chunk) * TAG_READ_BYTES)
+                tags.update(zip(chunk, chunk_tags))
+                elapsed = time.perf_counter() - started
+                self.log(f"Reading tags: {len(tags)}/{total} tracks ({len(tags) / max(elapsed, 1e-6):.0f} tracks/s)")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return tags
+
+    def scan_tags(self, rescan=False, dirty_paths=()):
+        """
+        Tag-driven scan: every audio file below the root, at any depth, grouped into
+        albums by album artist + album tag (discs stay inside one album). Only files
+        whose size/mtime changed have their tags re-read. With rescan=True directories
+        whose mtime hasn't moved since the last scan aren't listed again, and dirty_paths
+        limits the walk like it does for rescan().
+        Returns (albums, diff) shaped like scan() and rescan().
+        """
+        root = self.tracks_folder
+        started = time.perf_counter()
+        self.log("Starting tag-driven indexing...")
+        self.spend()
+        root_mtime = dir_mtime(root)
+        if root_mtime is None:
+            self.log("Tracks directory not found.")
+            return [], {"added": [], "removed": [], "modified": [], "moved": {}}
+        known = self.index.track_rows(root) if self.index else {}
+        if rescan and self.index:
+            self.target(root, dirty_paths)
+            self.known_dirs = self.index.dirs(root)
+            for path, (parent, _mtime) in self.known_dirs.items():
+                self.known_children.setdefault(parent, []).append(path)
+            for path, row in known.items():
+                self.known_files.setdefault(os.path.dirname(path), {})[path] = row[:2]
+        seen_dirs = {root: ("", root_mtime)}
+        files, top = self.list_dir(root, root_mtime)
+        with self.thread_pool() as pool:
+            for found, dirs in pool.map(lambda d: self.walk_audio(d[0], root, d[1]), top):
+                files.update(found)
+                seen_dirs.update(dirs)
+        self.log(f"Found {len(files)} tracks in {len(seen_dirs)} directories ({len(self.cover_files)} listed) "
+                 f"in {time.perf_counter() - started:.2f}s.")
+
+        stale = {p for p, st in files.items() if p not in known or known[p][:2] != st or not known[p][3]["fingerprint"]}
+        tags = {p: known[p][3] for p in files if p in known}
+        stale_paths = sorted(stale, key=natural_sort_key)
+        with self.thread_pool() as pool:
+            identified = list(pool.map(lambda p: self.identify(p, *files[p]), stale_paths))
+        unread = []
+        for path, (fingerprint, found) in zip(stale_paths, identified):
+            if found is None:
+                unread.append(path)
+                found = {"fingerprint": fingerprint}
+            tags[path] = found
+        for path, read in self.read_tags_parallel(unread).items():
+            tags[path] = dict(read, fingerprint=tags[path]["fingerprint"])
+
+        groups = {}
+        for path in sorted(files, key=natural_sort_key):
+            t = tags[path]
+            folder = os.path.dirname(path)
+            artist = t["albumartist"] or t["artist"] or "Unknown Artist"
+            album = t["album"] or os.path.basename(folder)
+            key = tag_album_key(root, artist, album)
+            groups.setdefault(key, (artist, album, []))[2].append(path)
+        albums = []
+        for key, (artist, album, paths) in groups.items():
+            paths.sort(key=lambda p: (tags[p]["disc_no"], tags[p]["track_no"], natural_sort_key(os.path.basename(p))))
+            albums.append((artist, album, key, paths[0]))
+        albums.sort(key=lambda a: (natural_sort_key(a[0]), natural_sort_key(a[1])))
+
+        diff = {"added": [], "removed": [], "modified": []}
+        if self.index:
+            before = {a[2]: a for a in self.index.albums(root)}
+            album_of = {p: key for key, (_artist, _album, paths) in groups.items() for p in paths}
+            moved = {p for p in files if p in known and p not in stale and known[p][2] != album_of[p]}
+            writes = [(p, album_of[p], files[p][0], files[p][1], tags[p]) for p in stale | moved]
+            touched = {album_of[p] for p in stale | moved} | {known[p][2] for p in moved}
+            touched |= {known[p][2] for p in known if p not in files}
+            self.index.store_tag_albums(albums, writes)
+            self.record_covers(albums)
+            self.index.drop_tracks([p for p in known if p not in files])
+            self.index.prune(root, set(groups))
+            self.index.set_dirs(root, seen_dirs)
+            for album in albums:
+                if album[2] not in before:
+                    diff["added"].append(album)
+                elif album[2] in touched or before[album[2]] != album:
+                    diff["modified"].append(album)
+            diff["removed"] = sorted(set(before) - set(groups), key=natural_sort_key)
+        diff["moved"] = dict(self.relocations)
+        self.deliver(albums, force=True)
+        elapsed = time.perf_counter() - started
+        self.log(
+            f"Tag scan: {len(files)} tracks, {len(unread)} re-read, {len(self.relocations)} moved, "
+            f"{len(albums)} albums in {elapsed:.2f}s "
+            f"({len(files) / max(elapsed, 1e-6):.0f} tracks/s)."
+        )
+        return albums, diff
+
+    def rescan(self, dirty_paths=(), check_files=False):
+        """
+        Compare directory mtimes against the index and only list the directories that changed.
+        dirty_paths limits the walk to them and their parents (see target). Files edited in
+        place don't move their directory's mtime; check_files=True compares file stats too.
+        Returns {"added": [...], "modified": [...], "removed": [...], "moved": {...}} with
+        4-tuples for added/modified, album paths for removed and {old: new} track paths for moved.
+        """
+        root = self.tracks_folder
+        self.target(root, dirty_paths)
+        dirty_paths = self.dirty_paths
+        diff = {"added": [], "removed": [], "modified": [], "moved": {}}
+        known_dirs = self.index.dirs(root)
+        known_children = {}
+        for path, (parent, _mtime) in known_dirs.items():
+            known_children.setdefault(parent, []).append(path)
+        seen_dirs = {}
+        listed = 0
+        checked = 0
+
+        def child_dirs(path, parent, mtime=None):
+            """Sub-directories of path; only lists it if its mtime moved since the last scan."""
+            nonlocal listed, checked
+            if mtime is None:
+                self.spend()
+                checked += 1
+                mtime = dir_mtime(path)
+            if mtime is None:
+                return None
+            seen_dirs[path] = (parent, mtime)
+            known = known_dirs.get(path)
+            if known and known[1] == mtime and path not in dirty_paths:
+                children = []
+                for child in sorted(known_children.get(path, []), key=natural_sort_key):
+                    if self.skips(child):
+                        child_mtime = known_dirs[child][1]
+                    else:
+                        self.spend()
+                        checked += 1
+                        child_mtime = dir_mtime(child)
+                    if child_mtime is not None:
+                        children.append((os.path.basename(child), child, child_mtime))
+                return children
+            listed += 1
+            try:
+                return self.list_subdirs(path)
+            except OSError as e:
+                self.log(f"{path}: error listing: {e}")
+                return None
 
-            artist_album_logs = []
-            for album in albums_in_artist:
-                album_path = os.path.join(artist_path, album)
-                if not os.path.isdir(album_path):
+        artists = child_dirs(root, "")
+        if artists is None:
+            self.log("Tracks directory not found.")
+            artists = []
+        indexed = {a[2] for a in self.index.albums(root)}
+        present = set()
+        reread = 0
+        # written once every changed album has been read, so tracks moved between two of them are still known
+        updates = []
+        for artist, artist_path, artist_mtime in artists:
+            album_dirs = child_dirs(artist_path, root, artist_mtime)
+            if album_dirs is None:
+                continue
+            for album, album_path, album_mtime in album_dirs:
+                seen_dirs[album_path] = (artist_path, album_mtime)
+                known = known_dirs.get(album_path)
+                unchanged = known and known[1] == album_mtime and album_path not in dirty_paths
+                if unchanged and not check_files:
+                    if album_path in indexed:
+                        present.add(album_path)
                     continue
+                listed += 1
                 try:
-                    audio_files = [f for f in os.listdir(album_path) if f.lower().endswith(SUPPORTED_FORMATS)]
-                except Exception as e:
-                    self.log.emit(f"{artist} - {album}: error listing files: {e}")
+                    scanned = self.scan_album(album_path)
+                except OSError as e:
+                    self.log(f"{album_path}: error listing files: {e}")
                     continue
-                if audio_files:
-                    first_audio = sorted(audio_files, key=natural_sort_key)[0]
-                    albums.append((artist, album, album_path, first_audio))
-                    artist_album_logs.append(album)
-            if artist_album_logs:
-                self.log.emit(f"{artist}: indexed albums -> " + ", ".join(artist_album_logs))
-            else:
-                self.log.emit(f"{artist}: no valid albums found.")
-            self.log.emit(f"Finished artist {artist} ({i+1}/{total_artists})")
-            self.msleep(10)
-        self.finished.emit(albums)
+                if not scanned:
+                    continue
+                first_audio, audio, changed = scanned
+                present.add(album_path)
+                if unchanged and not changed and album_path in indexed:
+                    continue
+                updates.append((artist, artist_path, album, album_path, first_audio, album_mtime, changed, audio))
+                reread += len(changed)
+                diff["modified" if album_path in indexed else "added"].append((artist, album, album_path, first_audio))
+        for update in updates:
+            self.index.update_album(*update)
+        diff["removed"] = sorted(indexed - present, key=natural_sort_key)
+        diff["moved"] = dict(self.relocations)
+        self.record_covers(diff["added"] + diff["modified"])
+        self.index.prune(root, present)
+        self.index.set_dirs(root, seen_dirs)
+        self.log(
+            f"Rescan: {checked} directories checked, {listed} listed, {reread} tracks re-read; "
+            f"{len(diff['added'])} added, {len(diff['modified'])} modified, {len(diff['removed'])} removed, "
+            f"{len(diff['moved'])} tracks moved."
+        )
+        return diff
+class IndexerWorker(QtCore.QThread):
+    """
+    Runs a LibraryScanner off the GUI thread. Albums stream out through batch(list)
+    while it walks, then finished(list) carries all of them as 4-tuples
+    (artist, album, album_path, first_audio).
+    With rescan=True it emits diff(dict) instead (see LibraryScanner.rescan) and
+    finished(list) carries only the added and modified albums.
+    With tag_mode=True albums come from LibraryScanner.scan_tags; their album_path
+    is a tag_album_key and first_audio an absolute path.
+    With low_priority=True every thread it uses asks the OS for background I/O priority.
+    moved(dict) carries {old path: new path} for tracks that were moved or renamed, before finished.
+    """
+    log = QtCore.pyqtSignal(str)
+    batch = QtCore.pyqtSignal(list)
+    finished = QtCore.pyqtSignal(list)
+    diff = QtCore.pyqtSignal(dict)
+    moved = QtCore.pyqtSignal(dict)
+
+    def __init__(self, tracks_folder, index=None, rescan=False, dirty_paths=None, workers=SCAN_WORKERS, io_budget=None, tag_mode=False,
+                 low_priority=False, check_files=False):
+        super().__init__()
+        self.tracks_folder = tracks_folder
+        self.index = index
+        self.rescan = rescan and index is not None
+        self.tag_mode = tag_mode
+        # directories to re-list even if their mtime looks unchanged (e.g. reported by LibraryWatcher)
+        self.dirty_paths = set(dirty_paths or ())
+        # also compare the files of unchanged directories (see LibraryScanner.rescan)
+        self.check_files = check_files
+        self.watch_dirs = set()  # every directory the scan recorded, for LibraryWatcher; set before finished
+        self.scanner = LibraryScanner(tracks_folder, index, workers, io_budget, log=self.log.emit,
+                                      on_albums=None if self.rescan else self.batch.emit, low_priority=low_priority)
+
+    def run(self):
+        if self.scanner.low_priority:
+            lower_io_priority()
+        if self.tag_mode:
+            albums, diff = self.scanner.scan_tags(self.rescan and not self.check_files, self.dirty_paths)
+        elif self.rescan:
+            diff = self.scanner.rescan(self.dirty_paths, self.check_files)
+        else:
+            albums, diff = self.scanner.scan(), None
+        if self.scanner.relocations:
+            self.moved.emit(dict(self.scanner.relocations))
+        if self.index is not None:
+            self.watch_dirs = set(self.index.dirs(self.tracks_folder))
+        if self.rescan:
+            self.diff.emit(diff)
+            self.finished.emit(diff["added"] + diff["modified"])
+        else:
+            self.finished.emit(albums)
+
+class TrackTableWorker(QtCore.QThread):
+    """Builds a TrackTable and its TrackSearchIndex from the index off the GUI thread; finished carries both."""
+    finished = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+
+    def run(self):
+        table = TrackTable.from_index(self.index)
+        self.finished.emit(table, TrackSearchIndex(table))
+class LibraryWatcher(QtCore.QObject):
+    """
+    Watches every directory the last scan walked and asks for one batched
+    rescan once a burst of changes settles (e.g. a whole album landing from OnTheSpot).
+    Falls back to polling when the OS watcher can't take every directory; a poll
+    emits an empty set, meaning "check everything".
+    """
+    rescanRequested = QtCore.pyqtSignal(set)
+    SETTLE_MS = 2000
+    MAX_WAIT_MS = 10000
+    POLL_INTERVAL_MS = 30000
+    WATCH_LIMIT = 8000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.dirty_paths = set()
+        self.first_event = None
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.settleTimer = QtCore.QTimer(self)
+        self.settleTimer.setSingleShot(True)
+        self.settleTimer.timeout.connect(self.flush)
+        self.pollTimer = QtCore.QTimer(self)
+        self.pollTimer.setInterval(self.POLL_INTERVAL_MS)
+        self.pollTimer.timeout.connect(self.flush)
+        self.polling = False
+
+    def set_directories(self, paths):
+        """Watch exactly these directories (what IndexerWorker.watch_dirs recorded)."""
+        paths = set(paths)
+        watched = set(self.watcher.directories())
+        if watched - paths:
+            self.watcher.removePaths(list(watched - paths))
+        failed = []
+        if len(paths) <= self.WATCH_LIMIT:
+            new = list(paths - watched)
+            if new:
+                failed = self.watcher.addPaths(new)
+        if len(paths) > self.WATCH_LIMIT or failed:
+            if not self.polling:
+                print(f"[DEBUG] LibraryWatcher: can't watch {len(paths)} directories, polling instead.")
+                if self.watcher.directories():
+                    self.watcher.removePaths(self.watcher.directories())
+                self.pollTimer.start()
+                self.polling = True
+        elif self.polling:
+            self.pollTimer.stop()
+            self.polling = False
+
+    def on_directory_changed(self, path):
+        self.dirty_paths.add(path)
+        now = QtCore.QDateTime.currentMSecsSinceEpoch()
+        if self.first_event is None:
+            self.first_event = now
+        # keep pushing the flush back while events keep arriving, but never past MAX_WAIT_MS
+        remaining = self.MAX_WAIT_MS - (now - self.first_event)
+        self.settleTimer.start(max(0, min(self.SETTLE_MS, remaining)))
+
+    def flush(self):
+        dirty = self.dirty_paths
+        self.dirty_paths = set()
+        self.first_event = None
+        self.rescanRequested.emit(dirty)
 class ManagerCursor(QtCore.QObject): #https://stackoverflow.com/questions/55455881/is-there-a-way-to-create-a-custom-animated-gif-qcursor
     def __init__(self, parent=None):
         super(ManagerCursor, self).__init__(parent)
@@ -1263,7 +3815,7 @@ class ManagerCursor(QtCore.QObject): #https://stackoverflow.com/questions/554558
                 self._last_cursor = self._widget.cursor()
             self._widget.setCursor(cursor)
 class LogSplashScreen(QtWidgets.QWidget):
-    start_indexing = QtCore.pyqtSignal(str)
+    start_indexing = QtCore.pyqtSignal(str, bool)
 
     def __init__(self):
         super().__init__(None, QtCore.Qt.FramelessWindowHint)
@@ -1273,12 +3825,16 @@ class LogSplashScreen(QtWidgets.QWidget):
         self.setStyleSheet("background-color: black; color: white;")
         layout = QtWidgets.QVBoxLayout(self)
         folderLayout = QtWidgets.QHBoxLayout()
-        self.folderLineEdit = QtWidgets.QLineEdit("./Tracks", self)
+        saved_roots = load_library_roots()
+        self.folderLineEdit = QtWidgets.QLineEdit(";".join(r["path"] for r in saved_roots) or "./Tracks", self)
+        self.folderLineEdit.setToolTip("Separate several library folders with ;")
         folderLayout.addWidget(self.folderLineEdit)
-        browseButton = QtWidgets.QPushButton("Browse", self)
+        browseButton = QtWidgets.QPushButton("Add Folder", self)
         browseButton.clicked.connect(self.browse_folder)
         folderLayout.addWidget(browseButton)
         layout.addLayout(folderLayout)
+        self.tagModeCheck = QtWidgets.QCheckBox("Group albums by tags instead of folders", self)
+        layout.addWidget(self.tagModeCheck)
         self.startButton = QtWidgets.QPushButton("Start Indexing", self)
         self.startButton.clicked.connect(self.emit_start_indexing)
         layout.addWidget(self.startButton)
@@ -1293,47 +3849,253 @@ class LogSplashScreen(QtWidgets.QWidget):
         self._manager.setWidget(self)
 
     def browse_folder(self):
-        folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Select Tracks Folder", self.folderLineEdit.text())
-        if folder:
-            self.folderLineEdit.setText(folder)
+        current = [p.strip() for p in self.folderLineEdit.text().split(";") if p.strip()]
+        folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Add Tracks Folder", current[-1] if current else "")
+        if folder and folder not in current:
+            self.folderLineEdit.setText(";".join(current + [folder]))
 
     def emit_start_indexing(self):
         self._manager.start()
         self.startButton.setEnabled(False)
         self.folderLineEdit.setEnabled(False)
-        self.start_indexing.emit(self.folderLineEdit.text())
+        self.tagModeCheck.setEnabled(False)
+        self.start_indexing.emit(self.folderLineEdit.text(), self.tagModeCheck.isChecked())
 
     def append_log(self, message):
         self.logOutput.append(message)
         self.logOutput.verticalScrollBar().setValue(self.logOutput.verticalScrollBar().maximum())
+CLI_COMMANDS = ("scan", "search", "stats", "verify", "bench")
+def cli_log(message):
+    print(message, file=sys.stderr)
+def cli_extract_covers(albums, index):
+    """
+    Same cover probing as CoverArtExtractionTask, decoding into QImage (no QApplication needed),
+    COVER_CHUNK_SIZE albums per task on a thread pool like CoverArtJob. Every cover found is
+    stored in the CoverStore, so the GUI starts with all its variants ready, and its
+    cover_palette in the index.
+    """
+    store = cover_store()
+    cover_refs = index.cover_refs() if index else {}
+
+    def probe(chunk):
+        refs = []
+        palettes = []
+        hashes = set()
+        found = decoded_bytes = 0
+        for artist, album_name, album_path, first_audio in chunk:
+            first_audio_path = os.path.join(album_path, first_audio)
+            source = cover_source(first_audio_path, cover_refs.get(album_path, ""))
+            try:
+                cover_data = read_cover(source)
+            except Exception as e:
+                cli_log(f"{artist} - {album_name}: {e}")
+                cover_data = None
+            variants = store.put(source, cover_data) if cover_data else None
+            if variants:
+                found += 1
+                decoded_bytes += len(cover_data)
+                refs.append((album_path, cover_ref_for(source, first_audio_path)))
+                palettes.append((album_path, cover_palette(variants[THUMBNAIL_SIZE])))
+                hashes.add(cover_hash(variants[THUMBNAIL_SIZE]))
+            else:
+                refs.append((album_path, "none"))
+        return refs, palettes, hashes, found, decoded_bytes
+
+    chunks = [albums[i:i + COVER_CHUNK_SIZE] for i in range(0, len(albums), COVER_CHUNK_SIZE)]
+    refs = []
+    palettes = []
+    hashes = set()
+    found = decoded_bytes = 0
+    with concurrent.futures.ThreadPoolExecutor(QtCore.QThread.idealThreadCount()) as pool:
+        for chunk_refs, chunk_palettes, chunk_hashes, chunk_found, chunk_bytes in pool.map(probe, chunks):
+            refs.extend(chunk_refs)
+            palettes.extend(chunk_palettes)
+            hashes |= chunk_hashes
+            found += chunk_found
+            decoded_bytes += chunk_bytes
+    if index:
+        index.set_cover_refs(refs)
+        index.set_palettes(palettes)
+    return found, len(hashes), decoded_bytes
+def cli_bench_covers(sources, size, repeat):
+    """
+    Thumbnails every cover in sources at size two ways, best of repeat runs each: full decode
+    then smooth scaling (how thumbnails used to be made) and decode_cover's reduced JPEG decode
+    then the same scaling. Also reports how far apart the two results are, per channel 0-255.
+    """
+    corpus = []
+    for source in sources:
+        try:
+            data = read_cover(source)
+        except Exception as e:
+            cli_log(f"{source}: {e}")
+            continue
+        if data:
+            corpus.append(data)
+    scale = lambda image: image.scaled(size, size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+    modes = {
+        "full": lambda data: scale(QtGui.QImage.fromData(data)),
+        "draft": lambda data: scale(decode_cover(data, size)),
+    }
+    result = {"covers": len(corpus), "cover_bytes": sum(map(len, corpus)), "size": size}
+    thumbs = {}
+    for mode, make in modes.items():
+        best = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            thumbs[mode] = [make(data) for data in corpus]
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        result[f"{mode}_seconds"] = round(best, 4)
+        result[f"{mode}_ms_per_cover"] = round(1000 * best / max(len(corpus), 1), 3)
+    result["speedup"] = round(result["full_seconds"] / max(result["draft_seconds"], 1e-9), 2)
+    jpeg_covers = longest = 0
+    for data in corpus:
+        buffer = QtCore.QBuffer()
+        buffer.setData(QtCore.QByteArray(data))
+        buffer.open(QtCore.QIODevice.ReadOnly)
+        reader = QtGui.QImageReader(buffer)
+        jpeg_covers += reader.format() in (b"jpeg", b"jpg")
+        longest += max(reader.size().width(), reader.size().height())
+    result["jpeg_covers"] = jpeg_covers
+    result["mean_source_px"] = round(longest / max(len(corpus), 1))
+    diffs = []
+    for full, draft in zip(thumbs["full"], thumbs["draft"]):
+        if full.isNull() or full.size() != draft.size():
+            continue
+        a = full.convertToFormat(QtGui.QImage.Format_RGB32).constBits().asstring(full.width() * full.height() * 4)
+        b = draft.convertToFormat(QtGui.QImage.Format_RGB32).constBits().asstring(full.width() * full.height() * 4)
+        diffs.append(sum(abs(x - y) for x, y in zip(a, b)) / (len(a) * 3 / 4))
+    result["mean_abs_diff"] = round(sum(diffs) / max(len(diffs), 1), 2)
+    return result
+def run_cli(argv):
+    """
+    Headless entry point: scan/search/stats/verify/bench without creating a QApplication.
+    Progress goes to stderr, one JSON object with the results and timings to stdout.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="BasicallySpotify", description="Index and query a music library without the GUI.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in CLI_COMMANDS:
+        cmd = sub.add_parser(name)
+        cmd.add_argument("root", help="Tracks folder")
+        cmd.add_argument("--index", default=INDEX_FILE, help="library index file (default: %(default)s)")
+        if name == "scan":
+            cmd.add_argument("--tags", action="store_true", help="group albums by tags instead of folders")
+            cmd.add_argument("--rescan", action="store_true", help="only look at directories whose mtime changed")
+            cmd.add_argument("--check-files", action="store_true", help="with --rescan, also compare every file's size/mtime")
+            cmd.add_argument("--workers", type=int, default=SCAN_WORKERS)
+            cmd.add_argument("--io-budget", type=float, default=None, help="max filesystem operations per second")
+            cmd.add_argument("--io-bytes", type=float, default=None, help="max bytes read per second")
+            cmd.add_argument("--low-priority", action="store_true", help="scan at the OS's idle I/O priority")
+            cmd.add_argument("--no-covers", action="store_true", help="skip cover extraction")
+            cmd.add_argument("--quiet", action="store_true")
+        if name == "search":
+            cmd.add_argument("query")
+        if name == "bench":
+            cmd.add_argument("--size", type=int, default=THUMBNAIL_SIZE, help="thumbnail size to decode for")
+            cmd.add_argument("--repeat", type=int, default=3, help="runs per method, the fastest counts")
+    args = parser.parse_args(argv)
+    root = os.path.abspath(args.root)
+    index = LibraryIndex(args.index)
+    result = {"command": args.command, "root": root}
+    started = time.perf_counter()
+
+    if args.command == "scan":
+        budget = IOBudget(args.io_budget, args.io_bytes) if args.io_budget or args.io_bytes else None
+        scanner = LibraryScanner(root, index, args.workers, budget, log=(lambda m: None) if args.quiet else cli_log,
+                                 low_priority=args.low_priority)
+        if args.low_priority:
+            lower_io_priority()
+        if args.tags:
+            albums, diff = scanner.scan_tags(rescan=args.rescan and not args.check_files)
+        elif args.rescan:
+            diff = scanner.rescan(check_files=args.check_files)
+            albums = index.albums(root)
+        else:
+            albums, diff = scanner.scan(), None
+        result["scan_seconds"] = round(time.perf_counter() - started, 4)
+        if diff is not None:
+            result["diff"] = {k: len(v) for k, v in diff.items()}
+        result["moved"] = len(scanner.relocations)
+        result["playlist_entries_relinked"] = relink_playlists(scanner.relocations)
+        counts = index.counts()
+        result["albums"] = len(albums)
+        result["tracks"] = counts["tracks"]
+        result["tracks_per_sec"] = round(counts["tracks"] / max(result["scan_seconds"], 1e-9), 1)
+        if not args.no_covers:
+            cover_started = time.perf_counter()
+            todo = albums if diff is None or args.tags else diff["added"] + diff["modified"]
+            found, unique, cover_bytes = cli_extract_covers(todo, index)
+            result["cover_seconds"] = round(time.perf_counter() - cover_started, 4)
+            result["covers_found"] = found
+            result["unique_covers"] = unique
+            result["cover_bytes"] = cover_bytes
+            result["albums_per_sec"] = round(len(todo) / max(result["cover_seconds"], 1e-9), 1)
+            compacted = cover_store().compact(album_cover_sources(index))
+            if compacted:
+                result["pack_bytes_before"], result["pack_bytes_after"] = compacted
+    elif args.command == "search":
+        search_index = TrackSearchIndex(TrackTable.from_index(index))
+        result["index_seconds"] = round(time.perf_counter() - started, 4)
+        search_started = time.perf_counter()
+        matches = search_index.search(args.query, root=root)
+        result["query_ms"] = round((time.perf_counter() - search_started) * 1000, 3)
+        result["query"] = args.query
+        result["matches"] = matches
+    elif args.command == "stats":
+        result.update(index.counts())
+        result["albums_under_root"] = len(index.albums(root))
+        rows = index.track_rows(root)
+        result["tracks_under_root"] = len(rows)
+        result["total_bytes"] = sum(r[0] for r in rows.values())
+        result["total_duration_sec"] = round(sum(r[3]["duration"] for r in rows.values()), 1)
+        table = TrackTable.from_index(index)
+        result["track_table_bytes"] = table.nbytes()
+    elif args.command == "verify":
+        missing, changed = [], []
+        for path, (size, mtime, _album, _tags) in index.track_rows(root).items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                missing.append(path)
+                continue
+            if (st.st_size, st.st_mtime) != (size, mtime):
+                changed.append(path)
+        result["missing"] = missing
+        result["changed"] = changed
+        result["ok"] = not missing and not changed
+    elif args.command == "bench":
+        # the covers of the albums a scan indexed under root
+        refs = index.cover_refs()
+        albums = [a for a in index.albums(root) if refs.get(a[2]) != "none"]
+        sources = [cover_source(os.path.join(a[2], a[3]), refs.get(a[2], "")) for a in albums]
+        result.update(cli_bench_covers(sources, args.size, args.repeat))
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    index.close()
+    print(json.dumps(result))
+    return 0 if result.get("ok", True) else 1
 # Global variable to hold the main window so it isn't garbage collected.
 MAIN_WINDOW = None
-INDEXER_WORKER = None
-def on_start_indexing(tracks_folder):
-    global INDEXER_WORKER
-    INDEXER_WORKER = IndexerWorker(tracks_folder)
-    INDEXER_WORKER.log.connect(splash.append_log)
-
-    def finished_handler(albums):
-        global INDEXER_WORKER
-        INDEXER_WORKER.deleteLater()
-        INDEXER_WORKER = None
-        notifier = CoverArtTaskNotifier()
-        notifier.finished.connect(cover_finished)
-        notifier.log.connect(splash.append_log)
-        task = CoverArtExtractionTask(albums, notifier)
-        QtCore.QThreadPool.globalInstance().start(task)
-
-    def cover_finished(enriched_albums):
-        global MAIN_WINDOW
-        MAIN_WINDOW = VinylPlayer()
-        MAIN_WINDOW.albumTree.populate_albums_data(enriched_albums)
-        splash.close()
-        MAIN_WINDOW.show()
-
-    INDEXER_WORKER.finished.connect(finished_handler)
-    INDEXER_WORKER.start()
+LIBRARY_INDEX = None
+def on_start_indexing(folders_text, tag_mode=False):
+    global MAIN_WINDOW, LIBRARY_INDEX
+    roots = library_roots_from_text(folders_text)
+    save_library_roots(roots)
+    if LIBRARY_INDEX is None:
+        LIBRARY_INDEX = LibraryIndex()
+    # the window opens straight away; the library fills in while indexing runs
+    MAIN_WINDOW = VinylPlayer()
+    MAIN_WINDOW.library_index = LIBRARY_INDEX
+    MAIN_WINDOW.library_roots = roots
+    MAIN_WINDOW.tag_mode = tag_mode
+    splash.close()
+    MAIN_WINDOW.show()
+    MAIN_WINDOW.index_library()
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # tag-driven indexing spawns reader processes, also from the .exe
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(run_cli(sys.argv[1:]))
     app = QtWidgets.QApplication(sys.argv)
     palette = QtGui.QPalette()
     palette.setColor(QtGui.QPalette.Window, QtGui.QColor("black"))